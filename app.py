@@ -1,7 +1,17 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from search import setup, main, fetch_course_prefix_from_database, fetch_course_titles_from_database
+from expansion import expansion_stats
+from batch import classify_stream, detect_format, read_courses, to_course, to_json
+from search import setup, match_course, get_ruleset, result_cache, reload_ruleset, dept_index, readiness
+from metrics import registry
+from config import configure_logging
+import logging
 import time
+import io
+import json
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
@@ -10,12 +20,24 @@ CORS(app)
 def index():
     return send_from_directory('templates', 'index.html')
 
+@app.route('/api/university', methods=['GET'])
+def get_universities():
+    query = request.args.get('query')
+
+    # look up universities starting with the query in the department index
+    universities = dept_index.university_names(query)
+
+    return jsonify({
+        'university': universities
+    })
+
 @app.route('/api/course_titles', methods=['GET'])
 def get_course_titles():
+    university = request.args.get('university')
     course_prefix = request.args.get('course_prefix')
 
-    # fetch course titles from your database
-    course_titles = fetch_course_titles_from_database(course_prefix)
+    # look up course titles in the department index
+    course_titles = dept_index.course_titles(university, course_prefix)
 
     return jsonify({
         'course_titles': course_titles
@@ -23,40 +45,105 @@ def get_course_titles():
 
 @app.route('/api/course_prefixes', methods=['GET'])
 def get_course_prefixes():
+    university = request.args.get('university')
     prefix_query = request.args.get('query')
 
-    # fetch course prefixes from your database
-    course_prefixes = fetch_course_prefix_from_database(prefix_query)
+    # look up course prefixes in the department index
+    course_prefixes = dept_index.course_prefixes(university, prefix_query)
 
     return jsonify({
         'course_prefixes': course_prefixes
     })
 
+@app.route('/api/course_prefix', methods=['GET'])
+def get_course_prefix():
+    # Same lookup as /api/course_prefixes, with the parameter and response names used by static/js/index.js
+    course_prefixes = dept_index.course_prefixes(request.args.get('university'), request.args.get('course_prefix'))
+
+    return jsonify({
+        'course_prefix': course_prefixes
+    })
+
 @app.route('/api/course_subject', methods=['POST'])
 def course_subject():
     try:
         data = request.get_json()
+        university = data.get('university') or ''
         course_prefix = data['course_prefix']
         course_title = data['course_title']
 
-        print(f"Course Prefix: {course_prefix}")
-        print(f"Course Title: {course_title}")
-        
+        logger.debug("Course Prefix: %s Course Title: %s", course_prefix, course_title)
+
         if len(course_prefix) > 10 or len(course_title) > 100:
             return jsonify({"error": "Input length exceeds the limit."}), 400
 
         start_time = time.time()
-        output_subject, similarity_rate, fetched_dept_names = main(course_prefix, course_title)
+        result = match_course(course_prefix, course_title, university)
         execution_time = time.time() - start_time
 
-        print(f"Execution time: {execution_time}")
+        logger.debug("Execution time: %s", execution_time)
 
-        # Convert fetched_dept_names to a list before including it in the response.
-        fetched_dept_names = list(fetched_dept_names)
+        # The response also carries the match method and the top-3 alternative subjects with their scores
+        return jsonify(to_json(result))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify({'course_subject': output_subject, 'similarity_rate': similarity_rate, 'department_abbreviations': fetched_dept_names})
+@app.route('/api/course_subject/batch', methods=['POST'])
+def course_subject_batch():
+    # Accept {"courses": [...]} as JSON, or a CSV / JSONL body, and stream one JSON line per course back
+    try:
+        if request.is_json:
+            courses = [to_course(row) for row in request.get_json()['courses']]
+        else:
+            body = io.StringIO(request.get_data(as_text=True))
+            courses = list(read_courses(body, detect_format(request.content_type)))
+    except Exception as e:
+        return jsonify({'error': f'Invalid batch input: {e}'}), 400
+
+    for row_number, (university, course_prefix, course_title) in enumerate(courses):
+        if len(course_prefix) > 10 or len(course_title) > 100:
+            return jsonify({"error": f"Input length exceeds the limit in row {row_number}."}), 400
+
+    spell_check = request.args.get('spell_check')
+    spell_check = None if spell_check is None else spell_check != '0'
+
+    def generate():
+        for result in classify_stream(courses, spell_check=spell_check):
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/ruleset', methods=['GET'])
+def ruleset_info():
+    # Report the version and load time of the reference data currently in memory, and the abbreviation expansion counters
+    return jsonify(dict(get_ruleset().info(), expansion=expansion_stats()))
+
+@app.route('/api/cache', methods=['GET'])
+def cache_info():
+    # Report the hit/miss counters of the result cache
+    return jsonify(result_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Per-stage latency histograms, decision path counters and cache counters of this worker, in the Prometheus text format
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # 200 once the reference data is loaded and the model warmed up, 503 before, so load balancers hold traffic back
+    status = readiness()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/reload', methods=['POST'])
+def reload_reference_data():
+    try:
+        # Reload the subjects and reference tables after a data fix, without restarting the workers.
+        # ?university=... (repeatable) also re-reads the department rows of universities edited in place.
+        rules = reload_ruleset(request.args.getlist('university'))
+        return jsonify(dict(rules.info(), dept_index_version=dept_index.version))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     setup()  # Call setup before starting the Flask application
     app.run(debug=True)
@@ -0,0 +1,128 @@
+import argparse
+import contextlib
+import csv
+import json
+import sys
+from itertools import islice, tee
+
+# Accepted column names for each field of an input row
+FIELD_ALIASES = {
+    'university': ('university', 'name'),
+    'course_prefix': ('course_prefix', 'prefix'),
+    'course_title': ('course_title', 'title'),
+}
+
+# Define function to normalise an input row (dict or sequence) to a (university, course_prefix, course_title) tuple
+def to_course(row):
+    if isinstance(row, dict):
+        values = []
+        for field, aliases in FIELD_ALIASES.items():
+            value = next((row[alias] for alias in aliases if row.get(alias) is not None), '')
+            values.append(str(value).strip())
+        return tuple(values)
+    university, course_prefix, course_title = row
+    return (str(university).strip(), str(course_prefix).strip(), str(course_title).strip())
+
+# Define function to read courses from a CSV (with a header row) or JSONL stream, one row at a time
+def read_courses(stream, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield to_course(row)
+    elif fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield to_course(json.loads(line))
+    else:
+        raise ValueError(f'Unsupported input format: {fmt}')
+
+# Define function to guess the input format from a file name or a content type
+def detect_format(name):
+    name = (name or '').lower()
+    if name.endswith('.csv') or 'csv' in name:
+        return 'csv'
+    return 'jsonl'
+
+# Define function to split an iterable into lists of at most chunk_size items
+def chunked(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+# Define function to classify courses chunk by chunk and yield one result dict per input row, in input order.
+# With processes other than 1 the chunks are spread over a pool of forked worker processes.
+def classify_stream(courses, chunk_size=1000, spell_check=None, processes=1):
+    from search import classify_batch
+
+    if processes != 1:
+        from worker_pool import WorkerPool
+
+        courses, inputs = tee(courses)
+        with WorkerPool(processes, chunk_size, spell_check=spell_check) as pool:
+            for (university, course_prefix, course_title), result in zip(inputs, pool.classify(courses)):
+                yield dict({'university': university, 'course_prefix': course_prefix, 'course_title': course_title},
+                           **to_json(result))
+        return
+
+    for chunk in chunked(courses, chunk_size):
+        for (university, course_prefix, course_title), result in zip(chunk, classify_batch(chunk, spell_check)):
+            yield dict({'university': university, 'course_prefix': course_prefix, 'course_title': course_title},
+                       **to_json(result))
+
+# Define function to make a pipeline result JSON serialisable
+def to_json(result):
+    return dict(result, similarity_rate=float(result['similarity_rate']),
+                department_abbreviations=list(result['department_abbreviations']))
+
+# Define function to write results as JSONL or CSV
+def write_results(results, stream, fmt):
+    if fmt == 'csv':
+        writer = None
+        for result in results:
+            row = dict(result, department_abbreviations='; '.join(result['department_abbreviations']),
+                       alternatives='; '.join(f"{alternative['subject']} ({alternative['score']:.2f})" for alternative in result['alternatives']))
+            if writer is None:
+                writer = csv.DictWriter(stream, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+    else:
+        for result in results:
+            stream.write(json.dumps(result) + '\n')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Classify a CSV or JSONL file of (university, course_prefix, course_title) rows.')
+    parser.add_argument('input', help='Input file, or - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='Output file, or - for stdout (default)')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='Defaults to the input file extension')
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'], help='Defaults to the output file extension, jsonl for stdout')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Number of courses classified per batch')
+    parser.add_argument('--workers', type=int, help='Worker processes, 0 for one per CPU (default: WORKER_PROCESSES)')
+    parser.add_argument('--no-spell-check', dest='spell_check', action='store_const', const=False, default=None,
+                        help='Skip spell correction of the course titles (default: BATCH_SPELL_CHECK)')
+    return parser.parse_args(argv)
+
+def run(argv=None):
+    from config import config, configure_logging
+    from search import setup
+
+    args = parse_args(argv)
+    configure_logging()
+    input_format = args.input_format or detect_format(args.input)
+    output_format = args.output_format or detect_format(args.output)
+
+    with contextlib.ExitStack() as stack:
+        source = sys.stdin if args.input == '-' else stack.enter_context(open(args.input, newline='', encoding='utf-8'))
+        target = sys.stdout if args.output == '-' else stack.enter_context(open(args.output, 'w', newline='', encoding='utf-8'))
+        # Keep the pipeline's progress output away from the results when they go to stdout
+        stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+
+        setup()
+        processes = config.WORKER_PROCESSES if args.workers is None else args.workers
+        results = classify_stream(read_courses(source, input_format), args.chunk_size, args.spell_check, processes)
+        write_results(results, target, output_format)
+
+if __name__ == '__main__':
+    run()
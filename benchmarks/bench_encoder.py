@@ -0,0 +1,93 @@
+"""Speed and parity of the sentence encoder backends against the reference PyTorch model.
+
+Run from the repository root, after exporting the ONNX model with `python encoders.py models/onnx --quantize`:
+
+    python -m benchmarks.bench_encoder --backends torch-int8 onnx onnx-int8 --onnx-dir models/onnx --threads 1 2 4
+
+For every backend, reports single-title and batched encode cost, the largest difference of a title/subject cosine score
+from the reference, top-1 agreement, and how many titles change side of the 0.55 and 0.50 thresholds. Exits with
+status 1 if a backend differs from the reference by more than --tolerance, so it can gate a backend change.
+"""
+import argparse
+import random
+import sys
+import time
+
+import torch
+
+from benchmarks.catalog import make_subjects, TITLE_TEMPLATES
+from encoders import load_encoder
+
+# Similarity thresholds of the pipeline: title match and department fallback
+THRESHOLDS = [0.55, 0.50]
+
+
+def timed_encode(encoder, texts, batch_size):
+    start_time = time.perf_counter()
+    single = [encoder.encode([text], batch_size=1, convert_to_tensor=True) for text in texts[:200]]
+    single_ms = (time.perf_counter() - start_time) / max(1, len(single)) * 1e3
+    start_time = time.perf_counter()
+    embeddings = encoder.encode(texts, batch_size=batch_size, convert_to_tensor=True)
+    batch_ms = (time.perf_counter() - start_time) / max(1, len(texts)) * 1e3
+    return torch.nn.functional.normalize(embeddings.float(), dim=1), single_ms, batch_ms
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    subjects = make_subjects(args.subjects, rng)
+    titles = [rng.choice(TITLE_TEMPLATES).format(subject=rng.choice(subjects)).title() for _ in range(args.titles)]
+
+    if args.threads:
+        torch.set_num_threads(args.threads[0])
+    reference = load_encoder(args.model, 'torch')
+    reference_titles, single_ms, batch_ms = timed_encode(reference, titles, args.batch_size)
+    reference_subjects = timed_encode(reference, subjects, args.batch_size)[0]
+    reference_scores = reference_titles @ reference_subjects.T
+    reference_best = reference_scores.max(dim=1)
+
+    header = f"{'backend':>11} {'threads':>7} {'ms/title':>9} {'batched':>8} {'max |d|':>8} {'top-1':>7}"
+    print(header + ''.join(f" {f'flips@{threshold}':>11}" for threshold in THRESHOLDS))
+    print(f"{'torch':>11} {args.threads[0] if args.threads else 0:>7} {single_ms:>9.2f} {batch_ms:>8.3f} {0:>8.4f} {1:>7.3f}"
+          + ''.join(f" {0:>11}" for threshold in THRESHOLDS))
+
+    failed = []
+    for backend in args.backends:
+        for threads in args.threads or [0]:
+            if backend.startswith('onnx'):
+                encoder = load_encoder(args.model, backend, args.onnx_dir, threads)
+            else:
+                if threads:
+                    torch.set_num_threads(threads)
+                encoder = load_encoder(args.model, backend)
+            title_embeddings, single_ms, batch_ms = timed_encode(encoder, titles, args.batch_size)
+            subject_embeddings = timed_encode(encoder, subjects, args.batch_size)[0]
+            scores = title_embeddings @ subject_embeddings.T
+            best = scores.max(dim=1)
+            max_difference = float((scores - reference_scores).abs().max())
+            agreement = float((best.indices == reference_best.indices).float().mean())
+            line = f"{backend:>11} {threads:>7} {single_ms:>9.2f} {batch_ms:>8.3f} {max_difference:>8.4f} {agreement:>7.3f}"
+            for threshold in THRESHOLDS:
+                line += f" {int(((reference_best.values >= threshold) != (best.values >= threshold)).sum()):>11}"
+            print(line)
+            if max_difference > args.tolerance:
+                failed.append(backend)
+
+    if failed:
+        print(f"parity: {', '.join(sorted(set(failed)))} differ from the reference by more than {args.tolerance}")
+        return 1
+    print(f"parity: every backend is within {args.tolerance} of the reference")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='paraphrase-MiniLM-L3-v2')
+    parser.add_argument('--backends', nargs='+', choices=['torch', 'torch-int8', 'onnx', 'onnx-int8'], default=['torch-int8'])
+    parser.add_argument('--onnx-dir', default='', help='Directory written by encoders.py, for the onnx backends')
+    parser.add_argument('--threads', type=int, nargs='*', default=[], help='Intra-op thread counts to measure, default the library default')
+    parser.add_argument('--subjects', type=int, default=1000)
+    parser.add_argument('--titles', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--tolerance', type=float, default=0.02, help='Largest accepted cosine score difference from the reference')
+    parser.add_argument('--seed', type=int, default=0)
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,218 @@
+"""Offline benchmark of the matching pipeline against a local SQLite stand-in for the production database.
+
+Seeds a synthetic catalog at the requested scale, runs main() one course at a time, classify_batch() in chunks and,
+with --mode pool, classify_batch() on a pool of 1 to N forked worker processes, and reports throughput, latency
+percentiles, peak RSS and accuracy. Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --subjects 1000 --rules 1000 --titles 100000 --single-titles 2000
+    python -m benchmarks.bench_pipeline --mode pool --processes 1 2 4 8 16 32     # scaling curve over the cores
+    python -m benchmarks.bench_pipeline --record-golden benchmarks/golden.jsonl     # on the reference commit
+    python -m benchmarks.bench_pipeline --golden benchmarks/golden.jsonl            # on the change being measured
+
+Accuracy is reported against the labels the catalog was generated with and, with --golden, against the subjects a
+reference run returned, so a change that alters any decision shows up as a drop in golden agreement.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.catalog import make_catalog
+from benchmarks.stand_in import HashingEncoder, SQLitePool, seed_database
+
+
+# Define function to return the peak resident set size of this process in MiB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+# Define function to summarise one run: throughput, latency percentiles (ms) and accuracy
+def summarise(mode, courses, subjects, latencies, elapsed, golden):
+    latencies = sorted(latencies)
+    correct = sum(1 for course, subject in zip(courses, subjects) if subject == course[3])
+    report = {
+        'mode': mode,
+        'courses': len(courses),
+        'throughput': len(courses) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1e3,
+        'p95_ms': percentile(latencies, 0.95) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'accuracy': correct / len(courses) if courses else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if golden is not None:
+        keys = [tuple(course[:3]) for course in courses]
+        compared = [(golden[key], subject) for key, subject in zip(keys, subjects) if key in golden]
+        report['golden_agreement'] = sum(1 for expected, subject in compared if expected == subject) / len(compared) if compared else None
+        report['golden_compared'] = len(compared)
+    return report
+
+
+def run_single(search, courses):
+    subjects = []
+    latencies = []
+    start_time = time.perf_counter()
+    for university, course_prefix, course_title, expected in courses:
+        course_start = time.perf_counter()
+        subjects.append(search.main(course_prefix, course_title, university)[0])
+        latencies.append(time.perf_counter() - course_start)
+    return subjects, latencies, time.perf_counter() - start_time
+
+
+# Latencies in batch mode are per chunk, the time a caller waits for one chunk of results
+def run_batch(search, courses, chunk_size):
+    subjects = []
+    latencies = []
+    start_time = time.perf_counter()
+    for offset in range(0, len(courses), chunk_size):
+        chunk = [(university, course_prefix, course_title) for university, course_prefix, course_title, expected in courses[offset:offset + chunk_size]]
+        chunk_start = time.perf_counter()
+        subjects.extend(result['course_subject'] for result in search.classify_batch(chunk))
+        latencies.append(time.perf_counter() - chunk_start)
+    return subjects, latencies, time.perf_counter() - start_time
+
+
+# Results come back in input order; the latency of a chunk is the time between two chunk boundaries of the results
+def run_pool(courses, processes, chunk_size):
+    from worker_pool import WorkerPool
+
+    subjects = []
+    latencies = []
+    with WorkerPool(processes, chunk_size) as pool:
+        start_time = chunk_start = time.perf_counter()
+        for result in pool.classify([course[:3] for course in courses]):
+            subjects.append(result['course_subject'])
+            if len(subjects) % chunk_size == 0:
+                latencies.append(time.perf_counter() - chunk_start)
+                chunk_start = time.perf_counter()
+        return subjects, latencies, time.perf_counter() - start_time
+
+
+def load_golden(path):
+    golden = {}
+    with open(path, encoding='utf-8') as stream:
+        for line in stream:
+            if line.strip():
+                row = json.loads(line)
+                golden[(row['university'], row['course_prefix'], row['course_title'])] = row['course_subject']
+    return golden
+
+
+def write_golden(path, courses, subjects):
+    with open(path, 'w', encoding='utf-8') as stream:
+        for (university, course_prefix, course_title, expected), subject in zip(courses, subjects):
+            stream.write(json.dumps({'university': university, 'course_prefix': course_prefix, 'course_title': course_title,
+                                     'course_subject': subject}) + '\n')
+
+
+def print_report(report):
+    line = (f"{report['mode']:>7} {report['courses']:>8} {report['throughput']:>10.1f} {report['p50_ms']:>9.2f} {report['p95_ms']:>9.2f} "
+            f"{report['p99_ms']:>9.2f} {report['peak_rss_mb']:>9.0f} {report['accuracy']:>9.3f}")
+    if 'golden_agreement' in report:
+        agreement = report['golden_agreement']
+        line += f" {agreement:>7.3f}" if agreement is not None else f" {'n/a':>7}"
+    print(line)
+
+
+# Define function to seed the stand-in database and point the pipeline at it; returns the imported search module
+def prepare(args, tables):
+    # The result cache would turn repeated synthetic titles into cache hits, and the snapshot would skip the database
+    os.environ['RESULT_CACHE_SIZE'] = '0' if not args.cache else os.environ.get('RESULT_CACHE_SIZE', '10000')
+    os.environ['RESULT_CACHE_URL'] = ''
+    os.environ['SNAPSHOT_DIR'] = ''
+    import search
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='course_subject_bench-'), 'reference.sqlite3')
+    seed_database(path, tables)
+    search.database.set_pool(SQLitePool(path))
+    if args.encoder == 'hashing':
+        search.model = HashingEncoder()
+    return search
+
+
+def run(args):
+    logging.basicConfig(level=logging.WARNING)
+    start_time = time.perf_counter()
+    tables, courses = make_catalog(args.subjects, args.rules, args.titles, args.universities, args.seed)
+    print(f"catalog: {args.subjects} subjects, {args.rules} rules, {len(courses)} titles "
+          f"({time.perf_counter() - start_time:.1f}s to generate)")
+
+    search = prepare(args, tables)
+    start_time = time.perf_counter()
+    search.setup()
+    print(f"setup: {time.perf_counter() - start_time:.1f}s, peak RSS {peak_rss_mb():.0f} MiB, encoder {args.encoder}")
+
+    golden = load_golden(args.golden) if args.golden else None
+    header = f"{'mode':>7} {'courses':>8} {'courses/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MiB':>9} {'accuracy':>9}"
+    print(header + (f" {'golden':>7}" if golden is not None else ''))
+
+    reports = []
+    batch_subjects = None
+    if 'single' in args.mode:
+        single_courses = courses[:args.single_titles] if args.single_titles else courses
+        subjects, latencies, elapsed = run_single(search, single_courses)
+        reports.append(summarise('single', single_courses, subjects, latencies, elapsed, golden))
+        print_report(reports[-1])
+    if 'batch' in args.mode:
+        batch_subjects, latencies, elapsed = run_batch(search, courses, args.chunk_size)
+        reports.append(summarise('batch', courses, batch_subjects, latencies, elapsed, golden))
+        print_report(reports[-1])
+    if 'pool' in args.mode:
+        pool_reports = []
+        for processes in args.processes:
+            subjects, latencies, elapsed = run_pool(courses, processes, args.pool_chunk_size)
+            pool_reports.append(dict(summarise(f'pool:{processes}', courses, subjects, latencies, elapsed, golden), processes=processes))
+            print_report(pool_reports[-1])
+        # Speedup of every pool size over the smallest one
+        for report in pool_reports:
+            report['speedup'] = report['throughput'] / pool_reports[0]['throughput'] if pool_reports[0]['throughput'] else 0.0
+        print('scaling: ' + ', '.join(f"{report['processes']} -> {report['speedup']:.2f}x" for report in pool_reports))
+        reports.extend(pool_reports)
+
+    if args.record_golden:
+        if batch_subjects is None:
+            batch_subjects, latencies, elapsed = run_batch(search, courses, args.chunk_size)
+        write_golden(args.record_golden, courses, batch_subjects)
+        print(f"golden: wrote {len(courses)} results to {args.record_golden}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as stream:
+            json.dump({'arguments': vars(args), 'reports': reports}, stream, indent=2)
+    return reports
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=1000, help='Number of subjects in the taxonomy')
+    parser.add_argument('--rules', type=int, default=1000, help='Number of keyword plus predefined rules')
+    parser.add_argument('--titles', type=int, default=100000, help='Number of course titles classified in batch mode')
+    parser.add_argument('--single-titles', type=int, default=2000, help='Titles classified one by one in single mode, 0 for all')
+    parser.add_argument('--universities', type=int, default=200)
+    parser.add_argument('--mode', nargs='+', choices=['single', 'batch', 'pool'], default=['single', 'batch'])
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Courses per classify_batch call')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker pool sizes measured in pool mode')
+    parser.add_argument('--pool-chunk-size', type=int, default=250, help='Courses per chunk sent to a pool worker')
+    parser.add_argument('--encoder', choices=['model', 'hashing'], default='model',
+                        help='hashing replaces the sentence encoder by a deterministic stand-in for machines without the model; '
+                             'latencies then exclude the model and accuracy is not meaningful')
+    parser.add_argument('--cache', action='store_true', help='Keep the result cache enabled')
+    parser.add_argument('--db', help='Path of the SQLite stand-in database (default: a temporary file)')
+    parser.add_argument('--golden', help='JSONL of reference results to compare against')
+    parser.add_argument('--record-golden', help='Write the batch results to this JSONL file as the new reference')
+    parser.add_argument('--json', help='Also write the reports to this JSON file')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    run(parse_args())
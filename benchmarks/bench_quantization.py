@@ -0,0 +1,64 @@
+"""Memory, latency and decision drift of the quantised subject embeddings against float32.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_quantization --subjects 1000 50000 --queries 2000
+
+For every dtype, reports the resident size of the subject vectors, the exact-search latency, how often the top-1
+subject differs from float32, the largest score difference, and how many course titles would change side of the
+0.55 embedding threshold and the 0.50 department fallback threshold. End to end, run bench_pipeline with
+EMBEDDING_DTYPE=float16 or int8 and --golden recorded at float32.
+"""
+import argparse
+import random
+import time
+
+import torch
+
+from benchmarks.catalog import make_subjects, TITLE_TEMPLATES
+from benchmarks.bench_vector_index import encode
+from quantization import DTYPES, SubjectVectors
+from vector_index import ExactIndex
+
+# Similarity thresholds of the pipeline: title match (score_title_match) and department fallback (match_subject_with_dept)
+THRESHOLDS = [0.55, 0.50]
+
+
+def timed_search(index, queries, k):
+    start_time = time.perf_counter()
+    results = [index.search(queries[offset:offset + 1], k)[0] for offset in range(queries.shape[0])]
+    return results, (time.perf_counter() - start_time) / queries.shape[0] * 1e3
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    header = f"{'subjects':>8} {'dtype':>8} {'MiB':>8} {'ms/query':>9} {'top-1 diff':>10} {'max |d|':>8}"
+    print(header + ''.join(f" {f'flips@{threshold}':>11}" for threshold in THRESHOLDS))
+    for count in args.subjects:
+        subjects = make_subjects(count, rng)
+        normalized = encode(subjects, args.encoder)
+        queries = encode([rng.choice(TITLE_TEMPLATES).format(subject=rng.choice(subjects)) for _ in range(args.queries)], args.encoder)
+
+        reference, _ = timed_search(ExactIndex(SubjectVectors.quantize(normalized, 'float32')), queries, 1)
+        for dtype in DTYPES:
+            vectors = SubjectVectors.quantize(normalized, dtype)
+            results, ms = timed_search(ExactIndex(vectors), queries, 1)
+            changed = sum(1 for want, got in zip(reference, results) if want[0][0] != got[0][0])
+            reference_scores = torch.tensor([hits[0][1] for hits in reference])
+            scores = torch.tensor([hits[0][1] for hits in results])
+            line = (f"{count:>8} {dtype:>8} {vectors.nbytes / 2 ** 20:>8.1f} {ms:>9.3f} {changed / len(results):>10.4f} "
+                    f"{float((scores - reference_scores).abs().max()):>8.5f}")
+            for threshold in THRESHOLDS:
+                flips = int(((reference_scores >= threshold) != (scores >= threshold)).sum())
+                line += f" {flips:>11}"
+            print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, nargs='+', default=[1000, 50000], help='Taxonomy sizes to benchmark')
+    parser.add_argument('--queries', type=int, default=2000, help='Number of course titles searched per size')
+    parser.add_argument('--encoder', choices=['model', 'hashing'], default='model',
+                        help='hashing uses the deterministic stand-in encoder instead of the sentence model')
+    parser.add_argument('--seed', type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,109 @@
+"""Micro-benchmark of the compiled keyword/predefined rule matcher against the linear per-rule scan.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rule_matcher --rules 100 1000 5000
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from rule_matcher import KeywordMatcher, PredefinedMatcher
+
+WORDS = ['introduction', 'advanced', 'calculus', 'biology', 'chemistry', 'physics', 'history', 'writing', 'composition',
+         'statistics', 'economics', 'psychology', 'laboratory', 'seminar', 'topics', 'methods', 'theory', 'design',
+         'systems', 'management', 'accounting', 'music', 'art', 'philosophy', 'literature', 'algebra', 'geometry']
+
+
+def random_word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+
+# Define function to generate keyword rules: mostly literals, some with word boundaries or anchors, like the real table
+def make_keyword_rules(count, rng):
+    rules = []
+    for index in range(count):
+        word = random_word(rng)
+        kind = index % 4
+        if kind == 0:
+            keyword = rf'\b{word}\b'
+        elif kind == 1:
+            keyword = f'^{word}'
+        else:
+            keyword = word
+        rules.append((keyword, f'Subject {index}'))
+    # A few rules that real titles hit, spread through the priority order
+    for position, word in zip(range(0, count, max(1, count // len(WORDS))), WORDS):
+        rules[position] = (rf'\b{word}\b', word.title())
+    return rules
+
+
+def make_predefined_rules(count, rng, departments):
+    return [('' if index % 3 == 0 else rng.choice(departments), f'{rng.choice(WORDS)} {random_word(rng)}', f'Subject {index}')
+            for index in range(count)]
+
+
+def make_titles(count, rng):
+    return [' '.join(rng.choice(WORDS + [random_word(rng)]) for _ in range(rng.randint(2, 5))).title() for _ in range(count)]
+
+
+# The per-request loops this matcher replaced
+def linear_keyword(rules, lower_title):
+    for keyword, subject in rules:
+        if re.search(keyword, lower_title):
+            return subject
+    return None
+
+
+def linear_predefined(rules, filtered_title, dept_names):
+    for dept, title, subject in rules:
+        if dept.lower() == '' and re.search(r'(?i)' + title, filtered_title.lower()):
+            return subject
+        elif dept.lower() in [d.lower() for d in dept_names] and re.search(r'(?i)' + title, filtered_title):
+            return subject
+    return None
+
+
+def timed(function, titles):
+    start_time = time.perf_counter()
+    results = [function(title) for title in titles]
+    return results, (time.perf_counter() - start_time) / len(titles) * 1e6
+
+
+def run(rule_counts, title_count, seed):
+    rng = random.Random(seed)
+    departments = [f'Department {index}' for index in range(50)]
+    titles = make_titles(title_count, rng)
+    course_depts = [rng.sample(departments, 2) for _ in titles]
+
+    print(f"{'rules':>7} {'kind':>11} {'build ms':>9} {'linear us':>10} {'compiled us':>12} {'speedup':>8}")
+    for count in rule_counts:
+        keyword_rules = make_keyword_rules(count, rng)
+        start_time = time.perf_counter()
+        keyword_matcher = KeywordMatcher(keyword_rules)
+        build_ms = (time.perf_counter() - start_time) * 1e3
+        expected, linear_us = timed(lambda title: linear_keyword(keyword_rules, title.lower()), titles)
+        actual, compiled_us = timed(lambda title: keyword_matcher.match(title.lower()), titles)
+        assert actual == expected, 'compiled keyword matcher disagrees with the linear scan'
+        print(f"{count:>7} {'keyword':>11} {build_ms:>9.1f} {linear_us:>10.1f} {compiled_us:>12.1f} {linear_us / compiled_us:>7.1f}x")
+
+        predefined_rules = make_predefined_rules(count, rng, departments)
+        start_time = time.perf_counter()
+        predefined_matcher = PredefinedMatcher([(dept.lower(), title, subject) for dept, title, subject in predefined_rules])
+        build_ms = (time.perf_counter() - start_time) * 1e3
+        pairs = list(zip(titles, course_depts))
+        expected, linear_us = timed(lambda pair: linear_predefined(predefined_rules, *pair), pairs)
+        actual, compiled_us = timed(lambda pair: predefined_matcher.match(pair[0], [d.lower() for d in pair[1]]), pairs)
+        assert actual == expected, 'compiled predefined matcher disagrees with the linear scan'
+        print(f"{count:>7} {'predefined':>11} {build_ms:>9.1f} {linear_us:>10.1f} {compiled_us:>12.1f} {linear_us / compiled_us:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, nargs='+', default=[100, 1000, 5000], help='Rule counts to benchmark')
+    parser.add_argument('--titles', type=int, default=2000, help='Number of course titles matched per rule count')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.rules, args.titles, args.seed)
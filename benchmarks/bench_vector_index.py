@@ -0,0 +1,88 @@
+"""Recall and latency of the approximate subject indexes against the exact search.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_vector_index --subjects 10000 50000 --nprobe 4 8 16 32 --ef 32 64 128
+
+Recall@k is the fraction of the exact top-k subjects an index returns, with and without a few excluded subjects.
+"""
+import argparse
+import random
+import time
+
+import torch
+
+from benchmarks.catalog import make_subjects, TITLE_TEMPLATES
+from quantization import SubjectVectors
+from vector_index import ExactIndex, HNSWIndex, IVFIndex
+
+
+def encode(texts, encoder, batch_size=256):
+    if encoder == 'hashing':
+        from benchmarks.stand_in import HashingEncoder
+
+        vectors = HashingEncoder().encode(texts, convert_to_tensor=True)
+    else:
+        from search import get_sentence_embeddings
+
+        vectors = get_sentence_embeddings(texts, batch_size)
+    return torch.nn.functional.normalize(vectors.float(), dim=1)
+
+
+def recall(expected, actual):
+    hits = sum(len({position for position, score in want} & {position for position, score in got}) for want, got in zip(expected, actual))
+    return hits / sum(len(want) for want in expected)
+
+
+def timed_search(index, queries, k, exclude):
+    start_time = time.perf_counter()
+    results = [index.search(queries[offset:offset + 1], k, exclude)[0] for offset in range(queries.shape[0])]
+    return results, (time.perf_counter() - start_time) / queries.shape[0] * 1e3
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    print(f"{'subjects':>8} {'index':>14} {'build s':>8} {'ms/query':>9} {'recall@1':>9} {f'recall@{args.k}':>9} {'excl@1':>7}")
+    for count in args.subjects:
+        subjects = make_subjects(count, rng)
+        vectors = SubjectVectors.quantize(encode(subjects, args.encoder), args.dtype)
+        queries = encode([rng.choice(TITLE_TEMPLATES).format(subject=rng.choice(subjects)) for _ in range(args.queries)], args.encoder)
+        exclude = torch.tensor(rng.sample(range(count), min(count, 5)))
+
+        exact = ExactIndex(vectors)
+        expected, exact_ms = timed_search(exact, queries, args.k, None)
+        expected_top1 = [hits[:1] for hits in expected]
+        expected_excluded, _ = timed_search(exact, queries, 1, exclude)
+        print(f"{count:>8} {'exact':>14} {0:>8.1f} {exact_ms:>9.3f} {1:>9.3f} {1:>9.3f} {1:>7.3f}")
+
+        indexes = []
+        for nprobe in args.nprobe:
+            indexes.append((f'ivf nprobe={nprobe}', lambda nprobe=nprobe: IVFIndex(vectors, nprobe=nprobe)))
+        for ef in args.ef:
+            indexes.append((f'hnsw ef={ef}', lambda ef=ef: HNSWIndex(vectors, ef=ef)))
+        for name, build in indexes:
+            start_time = time.perf_counter()
+            try:
+                index = build()
+            except ImportError:
+                print(f"{count:>8} {name:>14}  skipped, hnswlib is not installed")
+                continue
+            build_seconds = time.perf_counter() - start_time
+            actual, ms = timed_search(index, queries, args.k, None)
+            actual_excluded, _ = timed_search(index, queries, 1, exclude)
+            print(f"{count:>8} {name:>14} {build_seconds:>8.1f} {ms:>9.3f} {recall(expected_top1, [hits[:1] for hits in actual]):>9.3f} "
+                  f"{recall(expected, actual):>9.3f} {recall(expected_excluded, actual_excluded):>7.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, nargs='+', default=[10000, 50000], help='Taxonomy sizes to benchmark')
+    parser.add_argument('--queries', type=int, default=500, help='Number of course titles searched per size')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32], help='IVF clusters probed per query')
+    parser.add_argument('--ef', type=int, nargs='+', default=[32, 64, 128], help='HNSW search breadths')
+    parser.add_argument('--encoder', choices=['model', 'hashing'], default='model',
+                        help='hashing uses the deterministic stand-in encoder instead of the sentence model')
+    parser.add_argument('--dtype', choices=['float32', 'float16', 'int8'], default='float32', help='Stored subject embedding dtype')
+    parser.add_argument('--seed', type=int, default=0)
+    run(parser.parse_args())
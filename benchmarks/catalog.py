@@ -0,0 +1,128 @@
+"""Synthetic but realistic reference tables and course catalog for the offline benchmark.
+
+Every generated course carries the subject the pipeline is expected to return, by construction: titles built
+from a subject name expect that subject, titles containing a keyword or predefined rule expect the rule's subject,
+and so on. The same seed always gives the same catalog.
+"""
+import random
+
+DISCIPLINES = [
+    'Accounting', 'Anthropology', 'Architecture', 'Art History', 'Astronomy', 'Biochemistry', 'Biology', 'Business',
+    'Calculus', 'Chemistry', 'Civil Engineering', 'Communication', 'Computer Science', 'Criminal Justice', 'Dance',
+    'Data Science', 'Economics', 'Education', 'Electrical Engineering', 'English', 'Environmental Science', 'Finance',
+    'Geography', 'Geology', 'Graphic Design', 'Health Science', 'History', 'Hospitality', 'Journalism', 'Kinesiology',
+    'Linguistics', 'Literature', 'Management', 'Marketing', 'Mathematics', 'Mechanical Engineering', 'Microbiology',
+    'Music', 'Nursing', 'Nutrition', 'Philosophy', 'Photography', 'Physics', 'Political Science', 'Psychology',
+    'Public Health', 'Religious Studies', 'Social Work', 'Sociology', 'Statistics', 'Theatre', 'Writing', 'Zoology',
+]
+LANGUAGES = ['Spanish', 'French', 'German', 'Chinese', 'Japanese', 'Italian', 'Arabic', 'Russian']
+QUALIFIERS = ['Applied', 'Comparative', 'Computational', 'Environmental', 'Clinical', 'Digital', 'International',
+              'Quantitative', 'Experimental', 'Theoretical', 'Global', 'Public', 'Urban', 'Molecular', 'Cultural', 'Industrial']
+AREAS = ['Methods', 'Theory', 'Policy', 'Practice', 'Systems', 'Design', 'Analysis', 'Research', 'Ethics', 'Technology',
+         'Law', 'Leadership']
+ABBREVIATIONS = [('Intro', 'Introduction'), ('Adv', 'Advanced'), ('Mgmt', 'Management'), ('Sys', 'Systems'),
+                 ('Comp', 'Computer'), ('Sci', 'Science'), ('Engr', 'Engineering'), ('Env', 'Environmental'),
+                 ('Hist', 'History'), ('Lit', 'Literature'), ('Stat', 'Statistics'), ('Econ', 'Economics')]
+EXCLUDED_WORDS = ['I', 'II', 'III', 'To', 'Of', 'And', 'In', 'The', 'For', 'Introduction', 'Principles', 'Topics']
+EXCLUDED_TITLES = ['independent study', 'directed research', 'special problems']
+SCIENCE_KEYWORDS = ['science', 'biology', 'chemistry', 'physics']
+RULE_WORDS = ['capstone', 'practicum', 'internship', 'colloquium', 'studio', 'workshop', 'fieldwork', 'residency',
+              'symposium', 'tutorial', 'clerkship', 'apprenticeship']
+TITLE_TEMPLATES = ['{subject}', 'Introduction to {subject}', '{subject} I', '{subject} II', 'Principles of {subject}',
+                   'Topics in {subject}', 'Intro to {subject}', 'Adv {subject}', 'Foundations of {subject}']
+
+
+# Define function to generate count distinct subject names, starting with the real disciplines
+def make_subjects(count, rng):
+    subjects = list(dict.fromkeys(DISCIPLINES + LANGUAGES))
+    generators = [
+        lambda: f'{rng.choice(QUALIFIERS)} {rng.choice(DISCIPLINES)}',
+        lambda: f'{rng.choice(DISCIPLINES)} {rng.choice(AREAS)}',
+        lambda: f'{rng.choice(QUALIFIERS)} {rng.choice(DISCIPLINES)} {rng.choice(AREAS)}',
+        lambda: f'{rng.choice(DISCIPLINES)} and {rng.choice(DISCIPLINES)} {rng.choice(AREAS)}',
+    ]
+    seen = set(subjects)
+    attempts = 0
+    while len(subjects) < count:
+        attempts += 1
+        subject = rng.choice(generators)()
+        if subject in seen:
+            if attempts < count * 20:
+                continue
+            subject = f'{subject} {len(subjects)}'
+        seen.add(subject)
+        subjects.append(subject)
+    return subjects[:count]
+
+
+# Define function to derive a course prefix such as "CS" or "BIOL" from a subject name
+def prefix_for(subject, index):
+    words = [word for word in subject.split() if word[0].isupper()]
+    prefix = ''.join(word[0] for word in words) if len(words) > 1 else subject[:4]
+    return f'{prefix.upper()}{index % 10 if index >= len(DISCIPLINES) + len(LANGUAGES) else ""}'
+
+
+# Define function to generate the reference tables and labelled courses.
+# Returns (tables, courses) where tables maps table name -> rows and courses are (university, prefix, title, expected).
+def make_catalog(subject_count=1000, rule_count=1000, title_count=100000, university_count=200, seed=0):
+    rng = random.Random(seed)
+    subjects = make_subjects(subject_count, rng)
+    prefixes = {subject: prefix_for(subject, index) for index, subject in enumerate(subjects)}
+
+    # Keyword rules on course-format words and numbered course codes, e.g. "\bcapstone\b" or "\bst42\b"
+    keyword_rules = []
+    for index in range(rule_count // 2):
+        word = RULE_WORDS[index] if index < len(RULE_WORDS) else f'st{index}'
+        keyword_rules.append((rf'\b{word}\b', rng.choice(subjects)))
+    # Predefined rules: half apply to every department, half only to one department
+    predefined_rules = []
+    for index in range(rule_count - len(keyword_rules)):
+        subject = rng.choice(subjects)
+        dept = '' if index % 2 == 0 else rng.choice(subjects)
+        predefined_rules.append((dept, rf'honors seminar {index}\b', subject))
+
+    universities = [f'University {index}' for index in range(university_count)]
+    dept_rows = []
+    offered = {}
+    for university in universities:
+        offered[university] = rng.sample(subjects, min(len(subjects), 60))
+        for subject in offered[university]:
+            dept_rows.append((university, prefixes[subject], subject, f'Introduction to {subject}'))
+
+    tables = {
+        'subjects': [(subject,) for subject in subjects],
+        'abbreviation': ABBREVIATIONS,
+        'dept_abbreviations': dept_rows,
+        'predefined_subjects': predefined_rules,
+        'science_keywords': [(keyword,) for keyword in SCIENCE_KEYWORDS],
+        'keyword_subjects': keyword_rules,
+        'excluded_words': [(word,) for word in EXCLUDED_WORDS],
+        'excluded_titles': [(title,) for title in EXCLUDED_TITLES],
+        'excluded_subjects': [('astronomy', 'Physics')],
+        'foreign_language_keywords': [(language,) for language in LANGUAGES],
+    }
+
+    global_rules = [rule for rule in predefined_rules[:400] if rule[0] == '']
+    courses = []
+    for _ in range(title_count):
+        university = rng.choice(universities)
+        subject = rng.choice(offered[university])
+        prefix = prefixes[subject]
+        kind = rng.random()
+        if kind < 0.05:
+            title = rng.choice(EXCLUDED_TITLES).title()
+            expected = f'Title excluded: {title}'
+        elif kind < 0.15 and keyword_rules:
+            keyword, expected = keyword_rules[rng.randrange(min(len(keyword_rules), len(RULE_WORDS)))]
+            title = f'{subject} {keyword[2:-2].title()}'
+        elif kind < 0.25 and global_rules:
+            dept, pattern, expected = rng.choice(global_rules)
+            title = pattern[:-2].title()
+        elif kind < 0.30:
+            expected = rng.choice(LANGUAGES)
+            title = f'{expected} {rng.choice(["I", "II", "Conversation", "Composition"])}'
+        else:
+            expected = subject
+            title = rng.choice(TITLE_TEMPLATES).format(subject=subject)
+        courses.append((university, prefix, title, expected))
+    return tables, courses
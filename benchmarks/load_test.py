@@ -0,0 +1,52 @@
+"""Load test of a running server's /api/course_subject endpoint.
+
+Start the server with the result cache off, since the courses are sent round-robin and repeated ones would be
+cache hits (e.g. `RESULT_CACHE_SIZE=0 RESULT_CACHE_URL= gunicorn app:app -c gunicorn.conf.py`), then from the
+repository root:
+
+    python -m benchmarks.load_test --url http://localhost:5000 --courses catalog.csv --concurrency 32 --requests 2000
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import read_courses, detect_format
+
+
+def post(url, course):
+    university, course_prefix, course_title = course
+    data = json.dumps({'university': university, 'course_prefix': course_prefix, 'course_title': course_title}).encode('utf-8')
+    request = urllib.request.Request(url + '/api/course_subject', data=data, headers={'Content-Type': 'application/json'})
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start_time
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(url, courses, concurrency, total):
+    requests = [courses[index % len(courses)] for index in range(total)]
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(lambda course: post(url, course), requests))
+    elapsed = time.perf_counter() - start_time
+    print(f"requests {total} ({len(set(requests))} distinct courses)  concurrency {concurrency}  elapsed {elapsed:.1f}s  throughput {total / elapsed:.1f} req/s")
+    print(f"latency ms  p50 {percentile(latencies, 0.50) * 1e3:.1f}  p95 {percentile(latencies, 0.95) * 1e3:.1f}  "
+          f"p99 {percentile(latencies, 0.99) * 1e3:.1f}  max {latencies[-1] * 1e3:.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--courses', required=True, help='CSV or JSONL file of courses to send, reused round-robin')
+    parser.add_argument('--concurrency', type=int, default=32, help='Number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='Total number of requests')
+    args = parser.parse_args()
+    with open(args.courses, newline='', encoding='utf-8') as stream:
+        courses = list(read_courses(stream, detect_format(args.courses)))
+    run(args.url.rstrip('/'), courses, args.concurrency, args.requests)
@@ -0,0 +1,135 @@
+"""Local stand-ins for the production Postgres database and, optionally, the sentence encoder.
+
+SQLitePool has the getconn/putconn/closeall interface of the psycopg2 pool and is installed as the pool of
+search.database, so the pipeline reads the reference tables through its usual queries.
+"""
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+import torch
+
+# The tables and columns the queries in search.py read
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (subject_list TEXT);
+CREATE TABLE IF NOT EXISTS abbreviation (abbreviations TEXT, subject TEXT);
+CREATE TABLE IF NOT EXISTS dept_abbreviations (name TEXT, courses TEXT, departments TEXT, course_title TEXT);
+CREATE TABLE IF NOT EXISTS predefined_subjects (dept TEXT, course_title TEXT, subject TEXT);
+CREATE TABLE IF NOT EXISTS science_keywords (science_keyword TEXT);
+CREATE TABLE IF NOT EXISTS keyword_subjects (keyword TEXT, subject TEXT);
+CREATE TABLE IF NOT EXISTS excluded_words (words TEXT);
+CREATE TABLE IF NOT EXISTS excluded_titles (titles TEXT);
+CREATE TABLE IF NOT EXISTS excluded_subjects (titles TEXT, subjects TEXT);
+CREATE TABLE IF NOT EXISTS foreign_language_keywords (foreign_languages TEXT);
+CREATE INDEX IF NOT EXISTS dept_abbreviations_name ON dept_abbreviations (name);
+"""
+
+# Columns of every table, in insert order
+TABLES = {
+    'subjects': ['subject_list'],
+    'abbreviation': ['abbreviations', 'subject'],
+    'dept_abbreviations': ['name', 'courses', 'departments', 'course_title'],
+    'predefined_subjects': ['dept', 'course_title', 'subject'],
+    'science_keywords': ['science_keyword'],
+    'keyword_subjects': ['keyword', 'subject'],
+    'excluded_words': ['words'],
+    'excluded_titles': ['titles'],
+    'excluded_subjects': ['titles', 'subjects'],
+    'foreign_language_keywords': ['foreign_languages'],
+}
+
+
+# psycopg2-style cursor over sqlite3: translates the %s placeholders
+class _Cursor(object):
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params))
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql.replace('%s', '?'), rows)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        self._cursor.close()
+
+
+class _Connection(object):
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return _Cursor(self._connection.cursor())
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+
+# Pool of sqlite3 connections to one database file, with the interface of psycopg2.pool.ThreadedConnectionPool
+class SQLitePool(object):
+    def __init__(self, path):
+        self.path = path
+        self._free = []
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return _Connection(sqlite3.connect(self.path, check_same_thread=False))
+
+    def putconn(self, connection, close=False):
+        with self._lock:
+            self._free.append(connection)
+
+    def closeall(self):
+        with self._lock:
+            for connection in self._free:
+                connection._connection.close()
+            self._free = []
+
+
+# Define function to create the reference tables in path and fill them with the rows of tables (name -> rows)
+def seed_database(path, tables):
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+        for name, columns in TABLES.items():
+            connection.execute(f'DELETE FROM {name}')
+            rows = tables.get(name, [])
+            if rows:
+                connection.executemany(f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})", rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+# Deterministic character-trigram encoder with the encode() interface of SentenceTransformer. It lets the benchmark
+# run where the model can't be downloaded; its scores are not those of the model, so use it for latency, not accuracy.
+class HashingEncoder(object):
+    def __init__(self, dimensions=384):
+        self.dimensions = dimensions
+
+    def _encode_one(self, sentence):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        text = f' {sentence.lower()} '
+        for index in range(len(text) - 2):
+            vector[zlib.crc32(text[index:index + 3].encode('utf-8')) % self.dimensions] += 1.0
+        return vector
+
+    def encode(self, sentences, batch_size=32, convert_to_tensor=False, **kwargs):
+        single = isinstance(sentences, str)
+        items = [sentences] if single else list(sentences)
+        matrix = np.stack([self._encode_one(sentence) for sentence in items]) if items else np.zeros((0, self.dimensions), dtype=np.float32)
+        result = torch.from_numpy(matrix) if convert_to_tensor else matrix
+        return result[0] if single else result
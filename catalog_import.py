@@ -0,0 +1,207 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+from itertools import islice
+
+from batch import chunked, detect_format, read_courses
+
+logger = logging.getLogger(__name__)
+
+RESULTS_TABLE = 'course_subject_results'
+# Version of the rows of courses that crashed a worker; it never matches a real version, so they are retried on a re-import
+ERROR_VERSION = 'error'
+
+# One row per classified course. version is the version of the reference data the result was computed with
+# (search.cache_version), so rows classified under the current rules and subjects can be skipped on a re-import.
+CREATE_RESULTS_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    university TEXT NOT NULL,
+    course_prefix TEXT NOT NULL,
+    course_title TEXT NOT NULL,
+    course_subject TEXT,
+    similarity_rate DOUBLE PRECISION,
+    match_method TEXT,
+    version TEXT NOT NULL,
+    classified_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (university, course_prefix, course_title)
+)
+"""
+
+UPSERT_RESULTS = """
+INSERT INTO {table} (university, course_prefix, course_title, course_subject, similarity_rate, match_method, version)
+VALUES %s
+ON CONFLICT (university, course_prefix, course_title) DO UPDATE SET
+    course_subject = EXCLUDED.course_subject, similarity_rate = EXCLUDED.similarity_rate, match_method = EXCLUDED.match_method,
+    version = EXCLUDED.version, classified_at = CURRENT_TIMESTAMP
+"""
+
+SELECT_CLASSIFIED = """
+SELECT r.university, r.course_prefix, r.course_title FROM {table} r
+JOIN (VALUES %s) AS v (university, course_prefix, course_title)
+  ON r.university = v.university AND r.course_prefix = v.course_prefix AND r.course_title = v.course_title
+WHERE r.version = {version}
+"""
+
+
+# Define function to create the results table if it doesn't exist
+def ensure_results_table(connection, table=RESULTS_TABLE):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(CREATE_RESULTS_TABLE.format(table=table))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+# Define function to return the courses of a chunk that are already in the results table under version
+def classified_courses(connection, courses, version, table=RESULTS_TABLE):
+    from psycopg2.extensions import adapt
+    from psycopg2.extras import execute_values
+
+    cursor = connection.cursor()
+    try:
+        rows = execute_values(cursor, SELECT_CLASSIFIED.format(table=table, version=adapt(version).getquoted().decode('utf-8')),
+                              courses, page_size=len(courses) or 1, fetch=True)
+    finally:
+        cursor.close()
+    return {tuple(row) for row in rows}
+
+
+# Define function to insert or update the results of a chunk in one bulk statement, and commit
+def write_results(connection, rows, table=RESULTS_TABLE, page_size=1000):
+    from psycopg2.extras import execute_values
+
+    cursor = connection.cursor()
+    try:
+        execute_values(cursor, UPSERT_RESULTS.format(table=table), rows, page_size=page_size)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Define function to identify an input file, so a checkpoint is only reused for the same file
+def input_identity(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def load_checkpoint(path, identity):
+    try:
+        with open(path, encoding='utf-8') as stream:
+            checkpoint = json.load(stream)
+    except (FileNotFoundError, ValueError):
+        return 0
+    if checkpoint.get('input') != identity:
+        logger.info("Ignoring checkpoint %s, it belongs to another input", path)
+        return 0
+    return checkpoint.get('rows_done', 0)
+
+
+# Define function to record how many input rows are done; written atomically so a crash never leaves half a file
+def save_checkpoint(path, identity, rows_done):
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(handle, 'w', encoding='utf-8') as stream:
+        json.dump({'input': identity, 'rows_done': rows_done}, stream)
+    os.replace(temp_path, path)
+
+
+# Define function to classify a stream of courses chunk by chunk and upsert the results. Courses already classified
+# under the current reference data version are skipped unless force is set. Only one chunk is held in memory.
+# on_chunk(rows_done) is called after each chunk is committed, e.g. to save a checkpoint. With a WorkerPool the
+# courses of each chunk are classified by its worker processes.
+def import_courses(courses, chunk_size=1000, spell_check=None, force=False, table=RESULTS_TABLE, on_chunk=None, rows_done=0, pool=None):
+    import search
+
+    stats = {'rows': 0, 'skipped': 0, 'classified': 0}
+    with search.database.connection() as connection:
+        ensure_results_table(connection, table)
+        for chunk in chunked(courses, chunk_size):
+            # Later duplicates of a course in the same chunk win, as they would across chunks
+            chunk_courses = list(dict.fromkeys(chunk))
+            version = search.cache_version(search.get_ruleset())
+            done = set() if force else classified_courses(connection, chunk_courses, version, table)
+            pending = [course for course in chunk_courses if course not in done]
+            if pending:
+                if pool is not None:
+                    # The workers keep the data they were forked with while this process may reload it, so each row
+                    # is stamped with the version its worker used; a re-import then reclassifies stale rows. Courses
+                    # that crashed their worker have no version.
+                    results = [(result_version or ERROR_VERSION, result) for result_version, result in pool.classify(pending, versions=True)]
+                else:
+                    results = [(version, result) for result in search.classify_batch(pending, spell_check)]
+                write_results(connection, [(university, course_prefix, course_title, result['course_subject'],
+                                            float(result['similarity_rate']), result['match_method'], result_version)
+                                           for (university, course_prefix, course_title), (result_version, result) in zip(pending, results)], table)
+            rows_done += len(chunk)
+            stats['rows'] += len(chunk)
+            stats['skipped'] += len(chunk_courses) - len(pending)
+            stats['classified'] += len(pending)
+            if on_chunk is not None:
+                on_chunk(rows_done)
+            logger.info("Imported %d rows: %d classified, %d already up to date", rows_done, stats['classified'], stats['skipped'])
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Classify a catalog of (university, course_prefix, course_title) rows into the results table.')
+    parser.add_argument('input', help='CSV or JSONL catalog file, or - for stdin')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='Defaults to the input file extension')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Number of courses classified and written per batch')
+    parser.add_argument('--table', default=RESULTS_TABLE, help='Results table, created if it does not exist')
+    parser.add_argument('--checkpoint', help='Checkpoint file to resume from (default: <input>.checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first row')
+    parser.add_argument('--workers', type=int, help='Worker processes, 0 for one per CPU (default: WORKER_PROCESSES)')
+    parser.add_argument('--force', action='store_true', help='Reclassify rows already classified under the current version')
+    parser.add_argument('--no-spell-check', dest='spell_check', action='store_const', const=False, default=None,
+                        help='Skip spell correction of the course titles (default: BATCH_SPELL_CHECK)')
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    from config import config, configure_logging
+    from search import setup
+
+    args = parse_args(argv)
+    configure_logging()
+    input_format = args.input_format or detect_format(args.input)
+
+    with contextlib.ExitStack() as stack:
+        source = sys.stdin if args.input == '-' else stack.enter_context(open(args.input, newline='', encoding='utf-8'))
+        courses = read_courses(source, input_format)
+        rows_done = 0
+        on_chunk = None
+        if args.input != '-':
+            # Resume after the last committed chunk; rows before it are read but not classified again
+            identity = input_identity(args.input)
+            checkpoint = args.checkpoint or args.input + '.checkpoint.json'
+            rows_done = 0 if args.restart else load_checkpoint(checkpoint, identity)
+            if rows_done:
+                logger.info("Resuming %s after row %d", args.input, rows_done)
+                courses = islice(courses, rows_done, None)
+            on_chunk = lambda done: save_checkpoint(checkpoint, identity, done)
+
+        setup()
+        processes = config.WORKER_PROCESSES if args.workers is None else args.workers
+        if processes != 1:
+            from worker_pool import WorkerPool, default_processes
+
+            # Each chunk is split evenly over the worker processes
+            processes = processes or default_processes()
+            pool = stack.enter_context(WorkerPool(processes, max(1, -(-args.chunk_size // processes)), spell_check=args.spell_check))
+        else:
+            pool = None
+        stats = import_courses(courses, args.chunk_size, args.spell_check, args.force, args.table, on_chunk, rows_done, pool)
+        logger.info("Import finished: %d rows read, %d classified, %d already up to date", stats['rows'], stats['classified'], stats['skipped'])
+        return stats
+
+
+if __name__ == '__main__':
+    run()
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+import logging
 
 class Config(object):
     DB_USERNAME = os.getenv('DB_USERNAME')  # The name of the environment variable is 'DB_USERNAME'
@@ -7,9 +7,43 @@ class Config(object):
     DB_NAME = os.getenv('DB_NAME')  # The name of the environment variable is 'DB_NAME'
     DB_HOST = os.getenv('DB_HOST')  # The name of the environment variable is 'DB_HOST'
     DB_PORT = os.getenv('DB_PORT')  # The name of the environment variable is 'DB_PORT'
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))  # Connections each worker opens when the pool is created
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))  # Upper bound on the connections of each worker
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # Seconds a thread waits for a free connection before giving up, 0 waits forever
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))  # Statements running longer are cancelled by Postgres, 0 disables
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '10'))  # Seconds to wait for a new connection to the database
+    RULESET_TTL = int(os.getenv('RULESET_TTL', '300'))  # Seconds before the in-memory reference tables are reloaded, 0 disables
+    MAX_EXPANSIONS = int(os.getenv('MAX_EXPANSIONS', '16'))  # Upper bound on abbreviation expansions scored per course title (at least 1)
+    SPELL_CACHE_SIZE = int(os.getenv('SPELL_CACHE_SIZE', '50000'))  # Number of memoised token corrections
+    BATCH_SPELL_CHECK = os.getenv('BATCH_SPELL_CHECK', '1') == '1'  # Set to 0 to skip spell correction in batch mode by default
+    WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))  # Processes used by batch.py and catalog_import.py, 0 for one per CPU
+    RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '10000'))  # Results kept in each worker's LRU cache, 0 disables it
+    RESULT_CACHE_URL = os.getenv('RESULT_CACHE_URL')  # Optional redis:// URL of a result cache shared by all workers
+    RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '86400'))  # Expiry in seconds of the shared result cache entries
+    MICROBATCH = os.getenv('MICROBATCH', '1') == '1'  # Merge concurrent encode calls into micro-batches, 0 disables
+    MICROBATCH_MAX_SIZE = int(os.getenv('MICROBATCH_MAX_SIZE', '64'))  # Sentences after which a micro-batch is encoded without waiting
+    MICROBATCH_WAIT_MS = float(os.getenv('MICROBATCH_WAIT_MS', '5'))  # How long the first request of a micro-batch waits for others
+    TORCH_THREADS = int(os.getenv('TORCH_THREADS', '0'))  # Intra-op threads used by torch per worker, 0 keeps the torch default
+    ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'torch')  # Sentence encoder: torch, torch-int8, onnx or onnx-int8 (need onnxruntime and ONNX_DIR)
+    ONNX_DIR = os.getenv('ONNX_DIR', '')  # Directory written by 'python encoders.py' for the onnx backends
+    ONNX_THREADS = int(os.getenv('ONNX_THREADS', '0'))  # Intra-op threads of the ONNX Runtime session per worker, 0 keeps the default
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '')  # Directory of the startup snapshot new workers load instead of the database, empty disables
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()  # DEBUG also logs the decision of every course
+    LEXICAL_MATCH = os.getenv('LEXICAL_MATCH', '1') == '1'  # Decide titles that name a subject without the model, 0 disables
+    LEXICAL_MIN_SCORE = float(os.getenv('LEXICAL_MIN_SCORE', '100'))  # RapidFuzz ratio for a title to name a subject; 100 only ignores case and punctuation
+    LEXICAL_WORKERS = int(os.getenv('LEXICAL_WORKERS', '1'))  # Threads per RapidFuzz cdist call, -1 uses every CPU
+    LEXICAL_CACHE_SIZE = int(os.getenv('LEXICAL_CACHE_SIZE', '50000'))  # Title words whose closest subject is memoised
+    EMBEDDING_DTYPE = os.getenv('EMBEDDING_DTYPE', 'float32')  # Stored subject embeddings: float32, float16 (half the memory), or int8 (a quarter)
+    VECTOR_INDEX = os.getenv('VECTOR_INDEX', 'exact')  # Subject similarity search: exact, ivf, or hnsw (needs hnswlib)
+    IVF_NLIST = int(os.getenv('IVF_NLIST', '0'))  # Number of IVF clusters, 0 uses the square root of the number of subjects
+    IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))  # IVF clusters searched per query; higher is slower with better recall
+    HNSW_EF = int(os.getenv('HNSW_EF', '64'))  # HNSW search breadth; higher is slower with better recall
+    HNSW_M = int(os.getenv('HNSW_M', '16'))  # HNSW graph degree
+    HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', '200'))  # HNSW build-time search breadth
 
 # Create an instance of the Config class
 config = Config()
 
-DATABASE_URI = f"postgresql://{config.DB_USERNAME}:{config.DB_PASSWORD}@{config.DB_HOST}:{config.DB_PORT}/{config.DB_NAME}"
-engine = create_engine(DATABASE_URI)
+# Define function to send the application's log messages to stderr at the configured level
+def configure_logging():
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
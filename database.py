@@ -0,0 +1,99 @@
+import contextlib
+import logging
+import threading
+import time
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the pool wait histogram buckets
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+pool_wait_seconds = registry.histogram('course_subject_db_pool_wait_seconds', 'Time spent waiting for a database connection from the pool',
+                                       buckets=WAIT_BUCKETS)
+pool_timeouts = registry.counter('course_subject_db_pool_timeouts_total', 'Requests for a database connection that gave up waiting')
+query_errors = registry.counter('course_subject_db_query_errors_total', 'Queries that failed, including those cancelled by the statement timeout')
+
+
+# Raised when no connection of the pool became free within the wait timeout
+class PoolTimeout(RuntimeError):
+    pass
+
+
+# The one way the application reaches the database. Connections come from a thread-safe pool, created on first
+# use by create_pool() (e.g. a psycopg2 ThreadedConnectionPool of at most max_connections connections). Threads
+# that find every connection in use wait for one, at most wait_timeout seconds, instead of failing with
+# "connection pool exhausted". A connection is always returned to the pool, and closed instead of reused when
+# the statement broke it.
+class Database(object):
+    def __init__(self, create_pool, max_connections=10, wait_timeout=30.0):
+        self.create_pool = create_pool
+        self.max_connections = max_connections
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self.in_use = 0
+
+    def get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = self.create_pool()
+        return self._pool
+
+    # Use another pool from now on (e.g. a stand-in), or None to create a new one on next use. The old pool is
+    # not closed: after a fork its connections belong to the parent process.
+    def set_pool(self, pool):
+        with self._lock:
+            self._pool = pool
+            self._slots = threading.BoundedSemaphore(self.max_connections)
+            self.in_use = 0
+
+    # Check a connection out of the pool for the duration of the with block
+    @contextlib.contextmanager
+    def connection(self):
+        slots = self._slots
+        start_time = time.perf_counter()
+        if not slots.acquire(timeout=self.wait_timeout or None):
+            pool_timeouts.inc()
+            raise PoolTimeout(f"No database connection became free within {self.wait_timeout}s "
+                              f"({self.max_connections} in use)")
+        pool_wait_seconds.observe(time.perf_counter() - start_time)
+        try:
+            pool = self.get_pool()
+            connection = pool.getconn()
+        except Exception:
+            slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield connection
+        finally:
+            # psycopg2 rolls back an open transaction when the connection is returned; a closed one is discarded
+            try:
+                pool.putconn(connection, close=bool(getattr(connection, 'closed', False)))
+            finally:
+                with self._lock:
+                    self.in_use -= 1
+                slots.release()
+
+    # Run one statement and return all its rows
+    def query(self, sql, params=()):
+        with self.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+            except Exception:
+                query_errors.inc()
+                raise
+            finally:
+                cursor.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
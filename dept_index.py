@@ -0,0 +1,150 @@
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# Define function to return the keys of a sorted list that start with prefix (a sorted list with bisect is our prefix trie)
+def _with_prefix(sorted_keys, prefix):
+    start = bisect.bisect_left(sorted_keys, prefix)
+    end = bisect.bisect_left(sorted_keys, prefix + '\uffff') if prefix else len(sorted_keys)
+    return sorted_keys[start:end]
+
+
+# The dept_abbreviations rows of one university, grouped by course prefix
+class UniversityEntry(object):
+    def __init__(self, name, rows):
+        self.name = name
+        self.row_count = len(rows)
+        # Content digest of the rows, independent of their order
+        self.digest = hashlib.sha1('\n'.join(sorted(repr(row) for row in rows)).encode('utf-8')).hexdigest()
+        self.courses = OrderedDict()  # lowercased courses -> (courses, [departments], [course titles])
+        for courses, department, course_title in rows:
+            courses = courses or ''
+            entry = self.courses.setdefault(courses.lower(), (courses, [], []))
+            if department and department not in entry[1]:
+                entry[1].append(department)
+            if course_title and course_title not in entry[2]:
+                entry[2].append(course_title)
+        self.sorted_courses = sorted(self.courses)
+
+    # Return the entry as JSON-friendly data, for the startup snapshot
+    def dump(self):
+        return [self.name, self.row_count, self.digest,
+                [[courses, departments, titles] for courses, departments, titles in self.courses.values()]]
+
+    # Rebuild an entry from dump() without the original rows
+    @classmethod
+    def restore(cls, data):
+        name, row_count, digest, courses = data
+        entry = cls(name, [])
+        entry.row_count = row_count
+        entry.digest = digest
+        for courses, departments, titles in courses:
+            entry.courses[(courses or '').lower()] = (courses, list(departments), list(titles))
+        entry.sorted_courses = sorted(entry.courses)
+        return entry
+
+
+# In-memory index over dept_abbreviations: normalised university -> course prefixes -> departments and course titles.
+# Replaces the LIKE queries used for department resolution and for the autocomplete endpoints.
+class DeptIndex(object):
+    def __init__(self, cache_size=10000):
+        # (lowercased university name -> UniversityEntry, sorted lowercased names, dept_names cache),
+        # swapped as a whole so concurrent readers see either the old or the new index
+        self._state = ({}, [], OrderedDict())
+        self.version = None  # content digest, identical in every worker that loaded the same rows
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @property
+    def universities(self):
+        return self._state[0]
+
+    # Replace the rows of the given universities (rows are (name, courses, departments, course_title));
+    # universities in removed are dropped. Entries of the other universities are kept as they are.
+    def update(self, rows, removed=()):
+        grouped = OrderedDict()
+        for name, courses, department, course_title in rows:
+            grouped.setdefault((name or '').lower(), (name or '', []))[1].append((courses, department, course_title))
+        with self._lock:
+            universities = dict(self._state[0])
+            for lower_name in removed:
+                universities.pop(lower_name.lower(), None)
+            for lower_name, (name, university_rows) in grouped.items():
+                universities[lower_name] = UniversityEntry(name, university_rows)
+            self._install(universities)
+
+    # Swap in a new set of entries (caller holds _lock)
+    def _install(self, universities):
+        sorted_names = sorted(universities)
+        self._state = (universities, sorted_names, OrderedDict())
+        self.version = hashlib.sha1(''.join(universities[lower_name].digest for lower_name in sorted_names)
+                                    .encode('utf-8')).hexdigest()[:12]
+
+    # Replace the whole index
+    def load(self, rows):
+        with self._lock:
+            self._state = ({}, [], OrderedDict())
+        self.update(rows)
+
+    # Return the whole index as JSON-friendly data, for the startup snapshot
+    def dump(self):
+        return [entry.dump() for entry in self.universities.values()]
+
+    # Replace the whole index with data from dump(); the version is the same as that of the dumped index
+    def restore(self, data):
+        universities = {}
+        for entry_data in data:
+            entry = UniversityEntry.restore(entry_data)
+            universities[entry.name.lower()] = entry
+        with self._lock:
+            self._install(universities)
+
+    # Return the number of rows per lowercased university, to compare with the table when refreshing
+    def row_counts(self):
+        return {lower_name: entry.row_count for lower_name, entry in self.universities.items()}
+
+    # Return every distinct department
+    def departments(self):
+        return {department for entry in self.universities.values()
+                for courses, departments, titles in entry.courses.values() for department in departments}
+
+    # In-memory equivalent of "LOWER(name) LIKE %university% AND LOWER(courses) LIKE %course_prefix%", memoised
+    def dept_names(self, university, course_prefix):
+        universities, sorted_names, cache = self._state
+        key = ((university or '').lower(), (course_prefix or '').lower())
+        dept_names = cache.get(key)
+        if dept_names is None:
+            dept_names = []
+            for lower_name in sorted_names:
+                if key[0] not in lower_name:
+                    continue
+                for lower_courses, (courses, departments, titles) in universities[lower_name].courses.items():
+                    if key[1] in lower_courses:
+                        dept_names.extend(department for department in departments if department not in dept_names)
+            with self._lock:
+                cache[key] = dept_names
+                while len(cache) > self._cache_size:
+                    cache.popitem(last=False)
+        return list(dept_names)
+
+    # In-memory equivalent of "LOWER(name) LIKE university%"
+    def university_names(self, university):
+        universities, sorted_names, cache = self._state
+        return [universities[lower_name].name for lower_name in _with_prefix(sorted_names, (university or '').lower())]
+
+    # Yield the (courses, departments, titles) entries matching "LOWER(name) LIKE university% AND LOWER(courses) LIKE course_prefix%"
+    def _entries(self, university, course_prefix):
+        universities, sorted_names, cache = self._state
+        course_prefix = (course_prefix or '').lower()
+        for lower_name in _with_prefix(sorted_names, (university or '').lower()):
+            entry = universities[lower_name]
+            for lower_courses in _with_prefix(entry.sorted_courses, course_prefix):
+                yield entry.courses[lower_courses]
+
+    def course_prefixes(self, university, course_prefix):
+        return list(dict.fromkeys(courses for courses, departments, titles in self._entries(university, course_prefix)))
+
+    def course_titles(self, university, course_prefix):
+        return list(dict.fromkeys(title for courses, departments, titles in self._entries(university, course_prefix) for title in titles))
@@ -0,0 +1,84 @@
+# Precomputed best subject and score of every department name, for the department fallback of the title match.
+# Department names are a small set that rarely changes, so instead of encoding them for every course the fallback
+# looks them up here. A refresh only searches the new departments and, when the subject list changed, the added
+# subjects, plus the departments whose best subject was removed.
+class DeptSubjectTable(object):
+    def __init__(self, search):
+        self._search = search  # search(queries, k, subjects) -> per query a list of (subject, score), e.g. SimilarityEngine.search
+        # (department -> (subject, score), subject list the entries were computed against, its set, its fingerprint),
+        # swapped as a whole so concurrent readers see either the old or the new table
+        self._state = ({}, None, frozenset(), None)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def __contains__(self, dept):
+        return dept in self._state[0]
+
+    @property
+    def fingerprint(self):
+        return self._state[3]
+
+    # Bring the table in line with the given departments and subject list; returns the number of departments searched
+    def refresh(self, departments, subjects, fingerprint):
+        departments = sorted(set(departments))
+        entries, old_subjects, old_subject_set, old_fingerprint = self._state
+        subject_set = frozenset(subjects)
+        searched = 0
+
+        entries = {dept: entries[dept] for dept in departments if dept in entries}
+        if old_fingerprint != fingerprint:
+            # Entries pointing to a removed subject are recomputed, the others only compete with the added subjects
+            entries = {dept: entry for dept, entry in entries.items() if entry[0] in subject_set}
+            added = [subject for subject in subjects if subject not in old_subject_set]
+            if added and entries:
+                kept = list(entries)
+                for dept, hits in zip(kept, self._search(kept, 1, added)):
+                    if hits and hits[0][1] > entries[dept][1]:
+                        entries[dept] = hits[0]
+                searched += len(kept)
+
+        missing = [dept for dept in departments if dept not in entries]
+        if missing and subjects:
+            for dept, hits in zip(missing, self._search(missing, 1, subjects)):
+                if hits:
+                    entries[dept] = hits[0]
+            searched += len(missing)
+
+        self._state = (entries, subjects, subject_set, fingerprint)
+        return searched
+
+    # Return department -> (subject, score) for the departments whose precomputed subject is valid for subject_list,
+    # i.e. subject_list is (a filtered copy of) the subject list of the table and still contains that subject
+    def best(self, dept_names, subject_list):
+        entries, subjects, subject_set, fingerprint = self._state
+        allowed = None
+        if subject_list is not subjects:
+            allowed = set(subject_list)
+            if not allowed <= subject_set:
+                # Subjects the table doesn't know about, e.g. the subject list is being refreshed
+                self.misses += len(dept_names)
+                return {}
+        found = {}
+        for dept in dept_names:
+            entry = entries.get(dept)
+            if entry is not None and (allowed is None or entry[0] in allowed):
+                found[dept] = entry
+        self.hits += len(found)
+        self.misses += len(dept_names) - len(found)
+        return found
+
+    # Return the table as JSON-friendly data, for the startup snapshot
+    def dump(self):
+        entries, subjects, subject_set, fingerprint = self._state
+        return {'fingerprint': fingerprint, 'entries': [[dept, subject, score] for dept, (subject, score) in entries.items()]}
+
+    # Replace the table with data from dump(), if it was computed against the same subject list
+    def restore(self, data, subjects, fingerprint):
+        if not data or data.get('fingerprint') != fingerprint:
+            return False
+        entries = {dept: (subject, score) for dept, subject, score in data['entries']}
+        self._state = (entries, subjects, frozenset(subjects), fingerprint)
+        return True
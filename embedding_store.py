@@ -0,0 +1,109 @@
+import threading
+import hashlib
+import torch
+from quantization import SubjectVectors
+from vector_index import create_vector_index
+
+
+# Define function to compute a fingerprint of the subject list, used to detect changes in the subjects table
+def subjects_fingerprint(subjects):
+    digest = hashlib.sha1()
+    for subject in subjects:
+        digest.update(subject.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+# Immutable view of the encoded subjects, swapped as a whole so readers never see a half-built matrix
+class _Snapshot(object):
+    def __init__(self, subjects, vectors, fingerprint, version, index_factory=create_vector_index):
+        self.subjects = subjects
+        # Unit-length rows (SubjectVectors), so cosine similarity against the subjects is a single matrix multiply
+        self.vectors = vectors
+        self.fingerprint = fingerprint
+        self.version = version
+        self.index = {subject: i for i, subject in enumerate(subjects)}
+        # Nearest-neighbour index over the rows, built once per snapshot
+        self.vector_index = index_factory(vectors) if vectors is not None else None
+
+    # Return the row positions of the given subjects, or None when they are the full subject list.
+    # Raises KeyError if a subject is not in this snapshot.
+    def positions(self, subjects):
+        if subjects is self.subjects or subjects == self.subjects:
+            return None
+        return torch.tensor([self.index[subject] for subject in subjects], dtype=torch.long)
+
+    # Return the positions of the stored subjects that are not in subjects, or None when nothing is left out.
+    # This is how a filtered subject list (e.g. after exclude_subjects) is searched without rebuilding the index.
+    def excluded_positions(self, subjects):
+        positions = self.positions(subjects) if subjects is not None else None
+        if positions is None:
+            return None
+        excluded = torch.ones(len(self.subjects), dtype=torch.bool)
+        excluded[positions] = False
+        return excluded.nonzero().flatten()
+
+
+# Store holding the embedding of every subject, built once in a single batched encode.
+# Only the unit-length rows are kept, in the given dtype (float32, float16 or int8).
+class SubjectEmbeddingStore(object):
+    def __init__(self, encode, index_factory=create_vector_index, dtype='float32'):
+        self._encode = encode
+        self._index_factory = index_factory
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot([], None, None, 0)
+
+    @property
+    def subjects(self):
+        return self._snapshot.subjects
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def fingerprint(self):
+        return self._snapshot.fingerprint
+
+    # Return the current snapshot, so callers can use its vectors and index consistently across a batch
+    def current(self):
+        return self._snapshot
+
+    # Encode the subject list, unless it is identical to the one already stored. Returns True if re-encoded.
+    def build(self, subjects):
+        subjects = list(subjects)
+        fingerprint = subjects_fingerprint(subjects)
+        with self._lock:
+            current = self._snapshot
+            if current.vectors is not None and current.fingerprint == fingerprint:
+                return False
+            vectors = None
+            if subjects:
+                # The raw encoder output is dropped once quantised, only the stored representation stays resident
+                vectors = SubjectVectors.quantize(torch.nn.functional.normalize(self._encode(subjects), dim=1), self.dtype)
+            self._snapshot = _Snapshot(subjects, vectors, fingerprint, current.version + 1, self._index_factory)
+        return True
+
+    # Swap in subject vectors computed elsewhere (e.g. loaded from the startup snapshot) without encoding
+    def install(self, subjects, vectors, fingerprint):
+        subjects = list(subjects)
+        with self._lock:
+            self._snapshot = _Snapshot(subjects, vectors, fingerprint, self._snapshot.version + 1, self._index_factory)
+
+    # Return the unit-length float32 embedding rows for the given subjects, in the same order
+    def rows(self, subjects):
+        snapshot = self._snapshot
+        if subjects is snapshot.subjects or subjects == snapshot.subjects:
+            return snapshot.vectors.take() if snapshot.vectors is not None else None
+
+        # Reuse the stored rows through a row mask; only subjects unknown to the store are encoded
+        positions = [snapshot.index.get(subject) for subject in subjects]
+        missing = [subject for subject, position in zip(subjects, positions) if position is None]
+        if not missing:
+            return snapshot.vectors.take(torch.tensor(positions, dtype=torch.long))
+
+        known_embeddings = iter(snapshot.vectors.take(torch.tensor([position for position in positions if position is not None], dtype=torch.long)))
+        missing_embeddings = iter(torch.nn.functional.normalize(self._encode(missing), dim=1))
+        return torch.stack([next(known_embeddings) if position is not None else next(missing_embeddings)
+                            for position in positions])
@@ -0,0 +1,120 @@
+import argparse
+import json
+import logging
+import os
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Sentence encoder backends selectable with ENCODER_BACKEND:
+#   torch       the SentenceTransformer model in PyTorch eager mode
+#   torch-int8  the same model with its Linear layers dynamically quantised to int8
+#   onnx        the transformer exported to ONNX (see export_onnx) and run with ONNX Runtime
+#   onnx-int8   the exported transformer with int8 weights
+BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+ONNX_FILES = {'onnx': 'model.onnx', 'onnx-int8': 'model-int8.onnx'}
+ONNX_METADATA = 'encoder.json'
+
+
+# SentenceTransformer-compatible encoder running an exported transformer with ONNX Runtime: the tokenizer and the
+# mean pooling of the original model, without torch in the forward pass
+class OnnxEncoder(object):
+    def __init__(self, directory, quantized=False, threads=0):
+        import onnxruntime  # only needed for the onnx backends
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(directory, ONNX_METADATA), encoding='utf-8') as stream:
+            self.metadata = json.load(stream)
+        self.max_seq_length = self.metadata['max_seq_length']
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        path = os.path.join(directory, ONNX_FILES['onnx-int8' if quantized else 'onnx'])
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def _encode_batch(self, sentences):
+        features = self.tokenizer(sentences, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors='np')
+        inputs = {name: features[name].astype(np.int64) for name in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+        # Mean pooling over the real tokens, as the Pooling module of the sentence-transformers model does
+        mask = features['attention_mask'][:, :, None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, convert_to_tensor=False, **kwargs):
+        single = isinstance(sentences, str)
+        items = [sentences] if single else list(sentences)
+        dimensions = self.metadata['dimensions']
+        embeddings = np.zeros((len(items), dimensions), dtype=np.float32)
+        # Sort by length so each batch pads to similar lengths, as SentenceTransformer.encode does
+        order = sorted(range(len(items)), key=lambda index: -len(items[index]))
+        for start in range(0, len(order), batch_size):
+            positions = order[start:start + batch_size]
+            embeddings[positions] = self._encode_batch([items[position] for position in positions])
+        result = torch.from_numpy(embeddings) if convert_to_tensor else embeddings
+        return result[0] if single else result
+
+
+# Define function to export the transformer of a sentence-transformers model to ONNX in directory, with the
+# tokenizer and the pooling settings the OnnxEncoder needs; quantize also writes a model with int8 weights
+def export_onnx(model_name, directory, quantize=False, opset=14):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer, pooling = model[0], model[1]
+    if len(model) != 2 or not pooling.get_config_dict().get('pooling_mode_mean_tokens'):
+        raise ValueError(f"{model_name} is not a transformer with mean pooling, which is all the ONNX encoder implements")
+    os.makedirs(directory, exist_ok=True)
+    transformer.tokenizer.save_pretrained(directory)
+
+    features = transformer.tokenizer(['Introduction to Biology'], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in features]
+    dynamic_axes = {name: {0: 'batch', 1: 'tokens'} for name in input_names}
+    dynamic_axes['token_embeddings'] = {0: 'batch', 1: 'tokens'}
+    auto_model = transformer.auto_model.eval()
+    path = os.path.join(directory, ONNX_FILES['onnx'])
+    with torch.no_grad():
+        torch.onnx.export(auto_model, tuple(features[name] for name in input_names), path, input_names=input_names,
+                          output_names=['token_embeddings'], dynamic_axes=dynamic_axes, opset_version=opset)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(path, os.path.join(directory, ONNX_FILES['onnx-int8']), weight_type=QuantType.QInt8)
+
+    metadata = {'model': model_name, 'max_seq_length': transformer.max_seq_length,
+                'dimensions': model.get_sentence_embedding_dimension()}
+    with open(os.path.join(directory, ONNX_METADATA), 'w', encoding='utf-8') as stream:
+        json.dump(metadata, stream, indent=2)
+    return path
+
+
+# Define function to load the sentence encoder of model_name with the given backend. Every backend has the
+# encode(sentences, batch_size=..., convert_to_tensor=True) interface of SentenceTransformer.
+def load_encoder(model_name, backend='torch', onnx_dir='', threads=0):
+    if backend in ('onnx', 'onnx-int8'):
+        if not onnx_dir:
+            raise ValueError(f"ENCODER_BACKEND={backend} needs ONNX_DIR, the directory written by 'python encoders.py'")
+        encoder = OnnxEncoder(onnx_dir, backend == 'onnx-int8', threads)
+        if encoder.metadata['model'] != model_name:
+            logger.warning("The ONNX encoder in %s was exported from %s, not %s", onnx_dir, encoder.metadata['model'], model_name)
+        return encoder
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'torch':
+        return SentenceTransformer(model_name)
+    if backend == 'torch-int8':
+        # Linear layers get int8 weights; activations are quantised on the fly. CPU only.
+        model = SentenceTransformer(model_name, device='cpu')
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the sentence encoder to ONNX for ENCODER_BACKEND=onnx or onnx-int8.')
+    parser.add_argument('output', help='Directory to write the model, tokenizer and metadata to (ONNX_DIR)')
+    parser.add_argument('--model', default='paraphrase-MiniLM-L3-v2')
+    parser.add_argument('--quantize', action='store_true', help='Also write the int8 model used by onnx-int8')
+    args = parser.parse_args()
+    print(export_onnx(args.model, args.output, args.quantize))
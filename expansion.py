@@ -0,0 +1,64 @@
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Counters shared by every expander: how many titles were expanded and how often the candidate cap was hit
+_stats_lock = threading.Lock()
+_stats = {'titles': 0, 'candidates': 0, 'cap_hits': 0}
+
+def expansion_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def _record(candidates, cap_hit):
+    with _stats_lock:
+        _stats['titles'] += 1
+        _stats['candidates'] += candidates
+        _stats['cap_hits'] += int(cap_hit)
+
+
+# Abbreviation lookup built once from the abbreviation table. Keys are case-normalised; when several
+# rows normalise to the same key, the row whose case matches the word exactly is tried first.
+class AbbreviationExpander(object):
+    def __init__(self, abbreviations, max_candidates=16):
+        # The title itself is always scored, so at least one candidate is kept even with MAX_EXPANSIONS=0
+        self.max_candidates = max(1, max_candidates)
+        self.lookup = {}
+        for abbreviation, expansion in abbreviations.items():
+            if abbreviation and expansion:
+                self.lookup.setdefault(abbreviation.lower(), []).append((abbreviation, expansion))
+
+    # Return the possible replacements of a single word, or None if it is not an abbreviation
+    def options(self, word):
+        entries = self.lookup.get(word.lower())
+        if not entries:
+            return None
+        exact = [expansion for abbreviation, expansion in entries if abbreviation == word]
+        others = [expansion for abbreviation, expansion in entries if abbreviation != word]
+        return tuple(dict.fromkeys(exact + others))
+
+    # Lazily yield distinct expanded titles, first the one using the preferred expansion of every word
+    def iter_candidates(self, words):
+        choices = []
+        for word in words:
+            options = self.options(word)
+            if options is not None:
+                logger.debug("Expanded %s to %s", word, options[0])
+            choices.append(options or (word,))
+        seen = set()
+        for combination in itertools.product(*choices):
+            candidate = ' '.join(combination)
+            if candidate not in seen:
+                seen.add(candidate)
+                yield candidate
+
+    # Return at most max_candidates expanded titles
+    def expand(self, course_title, max_candidates=None):
+        max_candidates = max(1, max_candidates or self.max_candidates)
+        candidates = list(itertools.islice(self.iter_candidates(course_title.split()), max_candidates + 1))
+        cap_hit = len(candidates) > max_candidates
+        candidates = candidates[:max_candidates]
+        _record(len(candidates), cap_hit)
+        return candidates
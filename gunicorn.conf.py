@@ -0,0 +1,14 @@
+import os
+
+# One model per worker process, shared by the worker's request threads
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# Load the reference data and the subject embeddings before the worker accepts requests
+def post_worker_init(worker):
+    from search import setup
+
+    setup()
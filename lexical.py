@@ -0,0 +1,82 @@
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+from result_cache import LocalCache
+
+
+# Lexical matching of titles and title words against the subject list with RapidFuzz, ahead of the sentence model:
+# - exact(): a title that is a subject name (ignoring case and punctuation) is decided without the model
+# - best(): the closest subject of many words at once, one cdist call spread over `workers` threads,
+#   with the result of every word cached until the subject list changes
+class LexicalMatcher(object):
+    def __init__(self, workers=1, cache_size=50000, min_score=100):
+        self.workers = workers
+        self.min_score = min_score  # fuzz.ratio a title needs to be taken as a subject name by exact()
+        self._cache_size = cache_size
+        # (subjects, their set, fingerprint, processed subject name -> subject, token cache), swapped as a whole
+        self._state = ([], frozenset(), None, {}, LocalCache(cache_size))
+        self.hits = 0  # titles decided by exact()
+        self.lookups = 0  # words looked up by best()
+        self.cached = 0  # of which served from the token cache
+
+    # Point the matcher at the current subject list; the token cache is only dropped when the subjects changed
+    def update(self, subjects, fingerprint):
+        current_subjects, subject_set, current_fingerprint, names, cache = self._state
+        if fingerprint != current_fingerprint:
+            names = {}
+            for subject in subjects:
+                names.setdefault(utils.default_process(subject), subject)
+            cache = LocalCache(self._cache_size)
+        self._state = (subjects, frozenset(subjects), fingerprint, names, cache)
+
+    # Return the first subject of subject_list that one of the titles names, or None
+    def exact(self, titles, subject_list):
+        subjects, subject_set, fingerprint, names, cache = self._state
+        if self.min_score < 100:
+            # Near-exact: the best fuzz.ratio of all titles against all subjects in one call
+            if not titles or not subject_list:
+                return None
+            scores = process.cdist(titles, subject_list, scorer=fuzz.ratio, processor=utils.default_process,
+                                   score_cutoff=self.min_score, dtype=np.float64, workers=self.workers)
+            row, column = np.unravel_index(np.argmax(scores), scores.shape)
+            subject = subject_list[column] if scores[row, column] >= self.min_score else None
+        else:
+            subject = None
+            for title in titles:
+                subject = names.get(utils.default_process(title))
+                if subject is not None:
+                    break
+            # The title may name a subject that is excluded for it
+            if subject is not None and subject_list is not subjects and subject not in subject_list:
+                subject = None
+        if subject is not None:
+            self.hits += 1
+        return subject
+
+    # Return word -> (subject, score) for the closest subject of every word by fuzz.WRatio, the scorer of
+    # process.extractOne; on a tie the first subject wins, as with extractOne
+    def best(self, words, subject_list):
+        subjects, subject_set, fingerprint, names, cache = self._state
+        words = list(dict.fromkeys(words))
+        # The token cache holds matches against the full subject list; they still hold for a filtered copy of it
+        # (exclude_subjects) as long as the cached subject wasn't filtered out
+        cacheable = subject_list is subjects
+        allowed = None if cacheable else set(subject_list)
+        usable = cacheable or allowed <= subject_set
+        found = {}
+        missing = []
+        for word in words:
+            match = cache.get(word) if usable else None
+            if match is not None and (allowed is None or match[0] in allowed):
+                found[word] = match
+            else:
+                missing.append(word)
+        self.lookups += len(words)
+        self.cached += len(found)
+        if missing and subject_list:
+            scores = process.cdist(missing, subject_list, scorer=fuzz.WRatio, dtype=np.float64, workers=self.workers)
+            columns = np.argmax(scores, axis=1)
+            for word, row, column in zip(missing, scores, columns):
+                found[word] = (subject_list[column], float(row[column]))
+                if cacheable:
+                    cache.set(word, found[word])
+        return found
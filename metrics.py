@@ -0,0 +1,176 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Define function to format label names and values the way the Prometheus text format expects
+def _labels(names, values, extra=''):
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Monotonic counter with optional labels
+class Counter(object):
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.label_names, label_values)} {value}')
+        return lines
+
+
+# Histogram with fixed buckets and optional labels
+class Histogram(object):
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((label_values, (list(counts), total, count)) for label_values, (counts, total, count) in self._values.items())
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(self.label_names, label_values, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, label_values)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, label_values)} {count}')
+        return lines
+
+
+# Value read from a callback when the metrics are rendered, for counters kept elsewhere (e.g. the result cache)
+class Callback(object):
+    def __init__(self, name, help, kind, function):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.function = function
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', f'{self.name} {self.function()}']
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, function, kind='gauge'):
+        return self._add(Callback(name, help, kind, function))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # Return every metric in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A failing callback must not take the whole endpoint down
+                continue
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry; with several gunicorn workers every worker reports its own values
+registry = Registry()
+stage_seconds = registry.histogram('course_subject_stage_seconds', 'Time spent per request (or per batch) in each stage of the matching pipeline',
+                                   ['mode', 'stage'])
+decisions = registry.counter('course_subject_decisions_total', 'Classified courses by the decision path that produced the subject',
+                             ['path'])
+
+_local = threading.local()
+
+
+# Stage times of one request (or one batch), accumulated by span() and observed once when the request ends,
+# so a stage entered several times in a request counts as one observation
+class StageTimer(object):
+    def __init__(self, mode):
+        self.mode = mode
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def __enter__(self):
+        _local.timer = self
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.timer = None
+        self.add('total', time.perf_counter() - self.start_time)
+        for stage, seconds in self.stages.items():
+            stage_seconds.observe(seconds, self.mode, stage)
+        return False
+
+
+# Define function to time a whole request; inside another timed request it adds to that one instead
+def timed_request(mode='single'):
+    if getattr(_local, 'timer', None) is not None:
+        return contextlib.nullcontext(_local.timer)
+    return StageTimer(mode)
+
+
+# Times one stage of the pipeline into the current request's timer
+class span(object):
+    __slots__ = ('stage', 'start_time')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start_time
+        timer = getattr(_local, 'timer', None)
+        if timer is not None:
+            timer.add(self.stage, seconds)
+        else:
+            stage_seconds.observe(seconds, 'untimed', self.stage)
+        return False
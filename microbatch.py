@@ -0,0 +1,76 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Collects the encode calls of concurrent requests for a short window and runs them through the model as one
+# batch on a single background thread. The model is therefore only ever used by one thread at a time, and
+# threads waiting for their embeddings release the GIL for the other request threads.
+class MicroBatcher(object):
+    def __init__(self, encode, max_batch_size=64, max_wait=0.005):
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self._reset()
+        # The background thread does not survive a fork; start a fresh one in the child on first use
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    thread = threading.Thread(target=self._run, name='encode-microbatcher', daemon=True)
+                    thread.start()
+                    self._thread = thread
+
+    # Encode sentences (a string or a list of strings), waiting for the batch they end up in
+    def encode(self, sentences, batch_size=32):
+        single = isinstance(sentences, str)
+        items = [sentences] if single else list(sentences)
+        self._ensure_started()
+        future = Future()
+        self._queue.put((items, batch_size, future))
+        embeddings = future.result()
+        return embeddings[0] if single else embeddings
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        count = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            count += len(pending[-1][0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            sentences = [sentence for items, batch_size, future in pending for sentence in items]
+            batch_size = max(batch_size for items, batch_size, future in pending)
+            try:
+                embeddings = self._encode(sentences, batch_size) if sentences else None
+            except Exception as e:
+                for items, batch_size, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(pending)
+            offset = 0
+            for items, batch_size, future in pending:
+                future.set_result(embeddings[offset:offset + len(items)] if embeddings is not None else [])
+                offset += len(items)
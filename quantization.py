@@ -0,0 +1,61 @@
+import torch
+
+DTYPES = {'float32': torch.float32, 'float16': torch.float16, 'int8': torch.int8}
+
+
+# Unit-length subject embeddings stored as float32, float16, or int8 with one scale per row
+# (row = data * scale). Scores are computed block by block, so the full float32 matrix never exists at once.
+class SubjectVectors(object):
+    def __init__(self, data, scales=None, block_size=4096):
+        self.data = data  # (subjects x dimensions) tensor, possibly backed by a memory-mapped file
+        self.scales = scales  # float32 tensor with one scale per row for int8, None otherwise
+        self.block_size = block_size
+
+    # Define function to store unit-length float32 rows in the given representation
+    @classmethod
+    def quantize(cls, normalized, dtype='float32'):
+        normalized = normalized.float()
+        if dtype == 'float32':
+            return cls(normalized.contiguous())
+        if dtype == 'float16':
+            return cls(normalized.half())
+        if dtype == 'int8':
+            # Symmetric per-row quantisation: the largest component of each row maps to +/-127
+            scales = normalized.abs().amax(dim=1).clamp(min=1e-12) / 127.0
+            data = torch.round(normalized / scales[:, None]).clamp(-127, 127).to(torch.int8)
+            return cls(data, scales.float())
+        raise ValueError(f"Unknown embedding dtype {dtype!r}, expected one of {', '.join(DTYPES)}")
+
+    @property
+    def dtype(self):
+        return str(self.data.dtype).replace('torch.', '')
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.data.numel() * self.data.element_size() + (self.scales.numel() * 4 if self.scales is not None else 0)
+
+    def _dequantize(self, data, scales):
+        data = data.float()
+        return data * scales[:, None] if scales is not None else data
+
+    # Return the (queries x subjects) cosine similarities of unit-length float32 queries
+    def scores(self, queries):
+        if self.data.dtype == torch.float32:
+            return queries @ self.data.T
+        blocks = []
+        for start in range(0, len(self), self.block_size):
+            block = self.data[start:start + self.block_size].float()
+            scores = queries @ block.T
+            if self.scales is not None:
+                scores = scores * self.scales[start:start + self.block_size]
+            blocks.append(scores)
+        return torch.cat(blocks, dim=1) if blocks else queries.new_zeros((queries.shape[0], 0))
+
+    # Return the float32 rows at the given positions (all rows for None)
+    def take(self, positions=None):
+        if positions is None:
+            return self._dequantize(self.data, self.scales)
+        return self._dequantize(self.data[positions], self.scales[positions] if self.scales is not None else None)
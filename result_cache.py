@@ -0,0 +1,137 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# Define function to normalise a (university, course_prefix, course_title) lookup to what the pipeline actually
+# depends on, so that lookups sharing a key always get the same result: the department lookup lowercases the
+# university, the prefix is checked case-sensitively ('Edu'), and the title is split into words for the spell
+# checker, which is case-sensitive, or else title-cased
+def normalize_key(university, course_prefix, course_title, spell_check=True):
+    course_title = course_title or ''
+    return ((university or '').lower(), course_prefix or '', ' '.join(course_title.split()) if spell_check else course_title.title())
+
+
+# In-process LRU cache
+class LocalCache(object):
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Redis-backed cache shared by every gunicorn worker. Values are stored as JSON with an expiry.
+class RedisCache(object):
+    def __init__(self, url, ttl, prefix='course_subject:'):
+        import redis  # only needed when RESULT_CACHE_URL is set
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl or None)
+
+
+# Result cache in front of the matching pipeline. Entries are keyed on the normalised lookup and the version of
+# the reference data, so reloading the ruleset or the subject list makes every older entry unreachable.
+class ResultCache(object):
+    def __init__(self, maxsize, shared=None):
+        self.local = LocalCache(maxsize) if maxsize > 0 else None
+        self.shared = shared
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.shared_errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.local is not None or self.shared is not None
+
+    # Drop the in-process entries once the reference data version changes
+    def _check_version(self, version):
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    if self.local is not None:
+                        self.local.clear()
+                    self.version = version
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, version):
+        self._check_version(version)
+        value = self.local.get(key) if self.local is not None else None
+        if value is None and self.shared is not None:
+            try:
+                value = self.shared.get(version + '|' + '|'.join(key))
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning("An error occurred while reading the shared result cache: %s", e)
+            if value is not None and self.local is not None:
+                self.local.set(key, value)
+        self._count(value is not None)
+        # Callers get their own copy, so they can't modify the cached entry
+        return json.loads(json.dumps(value)) if value is not None else None
+
+    def set(self, key, version, value):
+        self._check_version(version)
+        value = json.loads(json.dumps(value))
+        if self.local is not None:
+            self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(version + '|' + '|'.join(key), value)
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning("An error occurred while writing the shared result cache: %s", e)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.local) if self.local is not None else 0,
+            'shared': self.shared is not None,
+            'shared_errors': self.shared_errors,
+            'version': self.version,
+        }
+
+
+# Define function to create the result cache from the configuration
+def create_result_cache(maxsize, shared_url=None, shared_ttl=0):
+    shared = RedisCache(shared_url, shared_ttl) if shared_url else None
+    return ResultCache(maxsize, shared)
@@ -0,0 +1,107 @@
+import re
+
+# Patterns that can't be merged with others: numbered/named backreferences and conditionals depend on group numbering
+_UNSAFE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+# A leading global inline flag such as (?i), which is only allowed at the start of a whole expression
+_GLOBAL_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+
+# Define function to turn a leading global inline flag into a scoped one, so the pattern can sit inside an alternation
+def _scoped(pattern):
+    match = _GLOBAL_FLAGS.match(pattern)
+    if match:
+        return f'(?{match.group(1)}:{pattern[match.end():]})'
+    return pattern
+
+
+# Matcher returning the position of the first pattern, in priority order, that matches anywhere in a text.
+# Consecutive patterns are compiled into one regex of the form
+#     (?=[\s\S]*?(?:p0))(?P<r0>)|(?=[\s\S]*?(?:p1))(?P<r1>)|...
+# matched at position 0: the alternation tries the branches in order, each lookahead is equivalent to
+# re.search(p, text), and the empty marker group of the winning branch identifies the pattern.
+class FirstMatch(object):
+    def __init__(self, patterns, flags=0, segment_size=1000):
+        self.flags = flags
+        self.segments = []  # list of (compiled regex, list of pattern ids or None for a single pattern, pattern id)
+        run = []
+        for pattern_id, pattern in patterns:
+            if _UNSAFE.search(pattern):
+                self._flush(run)
+                run = []
+                self._add_single(pattern_id, pattern)
+                continue
+            run.append((pattern_id, pattern))
+            if len(run) >= segment_size:
+                self._flush(run)
+                run = []
+        self._flush(run)
+
+    def _add_single(self, pattern_id, pattern):
+        self.segments.append((re.compile(pattern, self.flags), None, pattern_id))
+
+    def _flush(self, run):
+        if not run:
+            return
+        if len(run) == 1:
+            self._add_single(*run[0])
+            return
+        combined = '|'.join(f'(?=[\\s\\S]*?(?:{_scoped(pattern)}))(?P<r{position}>)'
+                            for position, (pattern_id, pattern) in enumerate(run))
+        try:
+            regex = re.compile(combined, self.flags)
+        except re.error:
+            # e.g. clashing group names between patterns; split the run until the halves compile
+            middle = len(run) // 2
+            self._flush(run[:middle])
+            self._flush(run[middle:])
+            return
+        self.segments.append((regex, [pattern_id for pattern_id, pattern in run], None))
+
+    # Return the id of the first matching pattern, or None
+    def search(self, text):
+        for regex, pattern_ids, pattern_id in self.segments:
+            if pattern_ids is None:
+                if regex.search(text):
+                    return pattern_id
+            else:
+                match = regex.match(text)
+                if match:
+                    return pattern_ids[int(match.lastgroup[1:])]
+        return None
+
+
+# keyword_subjects rules: the subject of the first keyword regex found in the lowercased title
+class KeywordMatcher(object):
+    def __init__(self, keyword_subjects):
+        self.subjects = [subject for keyword, subject in keyword_subjects]
+        self.matcher = FirstMatch(list(enumerate(keyword for keyword, subject in keyword_subjects)))
+
+    def match(self, lower_title):
+        index = self.matcher.search(lower_title)
+        return self.subjects[index] if index is not None else None
+
+
+# predefined_subjects rules, indexed by department. Rules without a department apply to every course and are
+# searched in the lowercased title; department rules only apply to courses of that department. The result is
+# the earliest rule, in table order, across the global rules and the rules of each of the course's departments.
+class PredefinedMatcher(object):
+    def __init__(self, predefined_subjects):
+        self.subjects = [subject for dept, title, subject in predefined_subjects]
+        global_rules = []
+        dept_rules = {}
+        for index, (dept, title, subject) in enumerate(predefined_subjects):
+            if dept == '':
+                global_rules.append((index, title))
+            else:
+                dept_rules.setdefault(dept, []).append((index, title))
+        self.global_matcher = FirstMatch(global_rules, re.IGNORECASE)
+        self.dept_matchers = {dept: FirstMatch(rules, re.IGNORECASE) for dept, rules in dept_rules.items()}
+
+    def match(self, filtered_title, lower_dept_names):
+        indices = [self.global_matcher.search(filtered_title.lower())]
+        for dept in set(lower_dept_names):
+            dept_matcher = self.dept_matchers.get(dept)
+            if dept_matcher is not None:
+                indices.append(dept_matcher.search(filtered_title))
+        indices = [index for index in indices if index is not None]
+        return self.subjects[min(indices)] if indices else None
@@ -0,0 +1,84 @@
+import re
+import time
+import hashlib
+import json
+from expansion import AbbreviationExpander
+from rule_matcher import KeywordMatcher, PredefinedMatcher
+
+
+# Immutable snapshot of the reference tables used by the matching pipeline.
+# Everything is normalised once at load time so the hot path never touches the database.
+class Ruleset(object):
+    def __init__(self, predefined_subjects, science_keywords, keyword_subjects, excluded_words, excluded_titles,
+                 excluded_subjects, foreign_language_keywords, abbreviations, expander, keyword_matcher, predefined_matcher,
+                 version, load_time, tables=None):
+        self.predefined_subjects = predefined_subjects  # tuple of (lowercased dept, compiled regex, subject)
+        self.science_keywords = science_keywords  # tuple of lowercased keywords
+        self.keyword_subjects = keyword_subjects  # tuple of (compiled regex, subject)
+        self.excluded_words = excluded_words  # frozenset of lowercased words
+        self.excluded_titles = excluded_titles  # frozenset of lowercased titles
+        self.excluded_subjects = excluded_subjects  # tuple of (lowercased title key, lowercased subject)
+        self.foreign_language_keywords = foreign_language_keywords  # tuple of lowercased keywords
+        self.abbreviations = abbreviations  # dict of abbreviation -> expansion
+        self.expander = expander  # case-normalised abbreviation lookup built from abbreviations
+        self.keyword_matcher = keyword_matcher  # keyword_subjects compiled into a first-match regex
+        self.predefined_matcher = predefined_matcher  # predefined_subjects compiled per department
+        self.version = version
+        self.load_time = load_time
+        self.tables = tables  # the raw rows this ruleset was built from, saved in the startup snapshot
+        self.loaded_at = time.time()
+
+    # Seconds since this snapshot was loaded
+    def age(self):
+        return time.time() - self.loaded_at
+
+    def info(self):
+        return {'version': self.version, 'load_time': self.load_time, 'loaded_at': self.loaded_at}
+
+
+# Define function to build a ruleset from the raw rows of the reference tables
+def build_ruleset(predefined_subjects, science_keywords, keyword_subjects, excluded_words, excluded_titles,
+                  excluded_subjects, foreign_language_keywords, abbreviations, load_time=0.0, max_expansions=16):
+    # The version is a content hash so that every worker loading the same data reports the same version
+    digest = hashlib.sha1(json.dumps([
+        [list(row) for row in predefined_subjects], list(science_keywords), [list(row) for row in keyword_subjects],
+        list(excluded_words), list(excluded_titles), [list(row) for row in excluded_subjects],
+        list(foreign_language_keywords), sorted(abbreviations.items()),
+    ], default=str).encode('utf-8')).hexdigest()[:12]
+
+    # Later rows win over earlier duplicates, as they did when the rows were loaded into dicts
+    predefined = {}
+    for dept, title, subject in predefined_subjects:
+        predefined[((dept or '').lower(), title)] = subject
+    keywords = {}
+    for keyword, subject in keyword_subjects:
+        keywords[keyword] = subject
+    lower_excluded_subjects = {}
+    for title, subject in excluded_subjects:
+        lower_excluded_subjects[(title or '').lower()] = (subject or '').lower()
+
+    return Ruleset(
+        predefined_subjects=tuple((dept, re.compile(r'(?i)' + title), subject) for (dept, title), subject in predefined.items()),
+        science_keywords=tuple(keyword.lower() for keyword in science_keywords if keyword),
+        keyword_subjects=tuple((re.compile(keyword), subject) for keyword, subject in keywords.items()),
+        excluded_words=frozenset(word.lower() for word in excluded_words if word),
+        excluded_titles=frozenset(title.lower() for title in excluded_titles if title),
+        excluded_subjects=tuple(lower_excluded_subjects.items()),
+        foreign_language_keywords=tuple(keyword.lower() for keyword in foreign_language_keywords if keyword),
+        abbreviations=dict(abbreviations),
+        expander=AbbreviationExpander(abbreviations, max_expansions),
+        keyword_matcher=KeywordMatcher(list(keywords.items())),
+        predefined_matcher=PredefinedMatcher([(dept, title, subject) for (dept, title), subject in predefined.items()]),
+        version=digest,
+        load_time=load_time,
+        tables={
+            'predefined_subjects': [list(row) for row in predefined_subjects],
+            'science_keywords': list(science_keywords),
+            'keyword_subjects': [list(row) for row in keyword_subjects],
+            'excluded_words': list(excluded_words),
+            'excluded_titles': list(excluded_titles),
+            'excluded_subjects': [list(row) for row in excluded_subjects],
+            'foreign_language_keywords': list(foreign_language_keywords),
+            'abbreviations': dict(abbreviations),
+        },
+    )
@@ -1,51 +1,119 @@
 # Import required libraries
-from sentence_transformers import SentenceTransformer
 import torch
 import re
-import psycopg2
-from rapidfuzz import fuzz, process
 import atexit
+import time
+import threading
+import logging
 import psycopg2.pool
-from config import config  # import the config object
-from autocorrect import Speller
-
-# Load pre-trained model
-model = SentenceTransformer('paraphrase-MiniLM-L3-v2')
+from config import config, configure_logging  # import the config object
+from embedding_store import SubjectEmbeddingStore
+from ruleset import build_ruleset
+from similarity import SimilarityEngine, merge_hits
+from vector_index import create_vector_index
+from expansion import AbbreviationExpander, expansion_stats
+from spelling import SpellCorrector, whitelist_words
+from result_cache import create_result_cache, normalize_key
+from dept_index import DeptIndex
+from dept_subjects import DeptSubjectTable
+from lexical import LexicalMatcher
+from microbatch import MicroBatcher
+from encoders import load_encoder
+from snapshot import load_snapshot, save_snapshot
+from metrics import decisions, registry, span, timed_request
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'paraphrase-MiniLM-L3-v2'
+# Embeddings of different backends are close but not identical, so the startup snapshot is tied to the backend too
+ENCODER_ID = MODEL_NAME if config.ENCODER_BACKEND == 'torch' else f'{MODEL_NAME}/{config.ENCODER_BACKEND}'
+
+# Pre-trained model, loaded once per process on first use and shared by all request threads
+model = None
+_model_load_lock = threading.Lock()
+# The tokenizer is not safe to use from several threads at once, so direct model calls are serialised
+_model_lock = threading.Lock()
+
+# Define function to load the pre-trained model with the configured backend, so importing this module doesn't pay for it
+def load_model():
+    global model
+    if model is None:
+        with _model_load_lock:
+            if model is None:
+                if config.TORCH_THREADS:
+                    torch.set_num_threads(config.TORCH_THREADS)
+                model = load_encoder(MODEL_NAME, config.ENCODER_BACKEND, config.ONNX_DIR, config.ONNX_THREADS)
+    return model
+
+def _encode(sentences, batch_size=32):
+    with _model_lock:
+        return load_model().encode(sentences, batch_size=batch_size, convert_to_tensor=True)
+
+# Concurrent requests' encode calls are merged into micro-batches within a short time window
+encode_batcher = MicroBatcher(_encode, config.MICROBATCH_MAX_SIZE, config.MICROBATCH_WAIT_MS / 1000.0) if config.MICROBATCH else None
 
 # Define function to get sentence embedding using pre-trained model
-def get_sentence_embeddings(sentences):
-    return model.encode(sentences, convert_to_tensor=True)
+def get_sentence_embeddings(sentences, batch_size=32):
+    if encode_batcher is not None:
+        return encode_batcher.encode(sentences, batch_size)
+    return _encode(sentences, batch_size)
 
 # Global variables for storing data fetched from the database
 subject_list = None
 abbreviations = None
 
-# Define function to replace abbreviations in a given sentence using a dictionary of abbreviations
-def replace_abbreviations(course_title, abbreviations):
-    words = course_title.split()
-    expansions = [[]]
-    for i, word in enumerate(words):
-        if word in abbreviations:
-            new_expansions = []
-            for expansion in expansions:
-                new_expansion = expansion + [abbreviations[word]]
-                new_expansions.append(new_expansion)
-            expansions = new_expansions  # Replacing old expansions with new ones
-            print(f"Expanded {word} to {abbreviations[word]}")  # Printing the expanded abbreviation
-        else:
-            for expansion in expansions:
-                expansion.append(word)
-    return [' '.join(expansion) for expansion in expansions]
+# Define function to build the configured nearest-neighbour index over the unit-length subject embeddings
+def build_vector_index(vectors):
+    return create_vector_index(vectors, config.VECTOR_INDEX, nlist=config.IVF_NLIST, nprobe=config.IVF_NPROBE,
+                               ef=config.HNSW_EF, M=config.HNSW_M, ef_construction=config.HNSW_EF_CONSTRUCTION)
+
+# Cached subject embeddings, rebuilt only when the subjects table changes
+subject_store = SubjectEmbeddingStore(get_sentence_embeddings, build_vector_index, config.EMBEDDING_DTYPE)
+# Top-k scoring of query strings against the cached subject matrix
+engine = SimilarityEngine(subject_store, get_sentence_embeddings)
+
+# In-memory index over dept_abbreviations for department resolution and autocomplete
+dept_index = DeptIndex()
+# Best subject of every department name, refreshed with the subjects and the department index
+dept_subjects = DeptSubjectTable(engine.search)
+# RapidFuzz matching of titles and title words against the subject names
+lexical_matcher = LexicalMatcher(config.LEXICAL_WORKERS, config.LEXICAL_CACHE_SIZE, config.LEXICAL_MIN_SCORE)
+
+# Cache of finished results for repeated (university, course_prefix, course_title) lookups
+result_cache = create_result_cache(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_URL, config.RESULT_CACHE_TTL)
+
+# Process-wide spell corrector, created once by get_spell_corrector()
+spell_corrector = None
+_spell_lock = threading.Lock()
+
+# Snapshot of the reference tables, swapped atomically by reload_ruleset()
+reference_rules = None
+_reload_lock = threading.Lock()
+
+# Set once setup() has loaded the reference data and warmed up the model
+ready = threading.Event()
+startup_info = {'source': None, 'startup_time': None, 'warm_up_time': None}
+# Key of the data last loaded from or saved to the startup snapshot
+_snapshot_key = None
+
+# Define function to replace abbreviations in a given sentence using a dictionary of abbreviations or a prebuilt
+# AbbreviationExpander. Returns a bounded, deduplicated list of expanded titles.
+def replace_abbreviations(course_title, abbreviations, max_candidates=None):
+    if not isinstance(abbreviations, AbbreviationExpander):
+        abbreviations = AbbreviationExpander(abbreviations, config.MAX_EXPANSIONS)
+    return abbreviations.expand(course_title, max_candidates)
 
 # Define function to check if a course is a foreign language course based on a list of keywords
-def is_foreign_language_course(course_title, subject_list):
-    foreign_language_keywords = fetch_foreign_language_from_database()
+def is_foreign_language_course(course_title, subject_list, rules=None):
+    rules = rules or get_ruleset()
+    lower_course_title = course_title.lower()
 
-    for keyword in foreign_language_keywords:
-        if keyword.lower() in course_title.lower():
+    for keyword in rules.foreign_language_keywords:
+        if keyword in lower_course_title:
             # Check if the keyword matches an existing subject
             for subject in subject_list:
-                if keyword.lower() == subject.lower():
+                if keyword == subject.lower():
                     return subject
             # If no match found in subject_list, return 'Foreign Language'
             return "Foreign Language"
@@ -64,408 +132,658 @@ def remove_trailing_non_numerics(prefix):
 
 # Define function to find the matching subject in a list based on course title
 def get_matching_subject(course_title, subject_list):
-    best_match = process.extractOne(course_title, subject_list)
-    return best_match[0] if best_match[1] > 90 else None # 80 is the confidence score, adjust as needed
+    best_match = lexical_matcher.best([course_title], subject_list).get(course_title)
+    return best_match[0] if best_match is not None and best_match[1] > 90 else None # 80 is the confidence score, adjust as needed
 
 # Define function to match subject using department names fetched from the database and a list of subjects
-def match_subject_with_dept(dept_names, subject_list):
-    highest_similarity = -1
-    matched_subject = "Special Topics"
-    # Convert subject_list to lowercase
-    lower_subject_list = [subject.lower() for subject in subject_list]
-
-    for dept in dept_names:
-        # Convert department name to lowercase
-        lower_dept = dept.lower()
-  
-        # Check if the dept is a foreign language course
-        foreign_language_subject = is_foreign_language_course(dept, subject_list)
-        if foreign_language_subject is not None:
-            return foreign_language_subject, 1.0
-
-        # Check for an exact match first
-        if lower_dept in lower_subject_list:
-            print("Exact match found for the dept")
-            return dept.title(), 1.0  # Return the title-cased department name
-        # If there's no exact or partial match, compute the semantic similarity
-        dept_embedding = get_sentence_embeddings(dept)
-        subject_embeddings = torch.stack([get_sentence_embeddings(subject) for subject in subject_list])
-
-        similarities = torch.nn.functional.cosine_similarity(dept_embedding, subject_embeddings)
-
-        index = torch.argmax(similarities)
-        similarity = similarities[index]
-
-        if similarity.item() > highest_similarity:
-            highest_similarity = similarity.item()
-            matched_subject = subject_list[index]
-
-    return matched_subject, highest_similarity
-
-def exclude_subjects(course_title, subjects):
-    excluded_subjects = fetch_excluded_subjects_from_database()
-    # Convert course title and excluded_combinations to lowercase for case-insensitive comparison
+def match_subject_with_dept(dept_names, subject_list, rules=None, embeddings=None):
+    rules = rules or get_ruleset()
+    with timed_request(), span('dept_fallback'):
+        highest_similarity = -1
+        matched_subject = "Special Topics"
+        # Convert subject_list to lowercase
+        lower_subject_list = [subject.lower() for subject in subject_list]
+
+        for dept in dept_names:
+            # Convert department name to lowercase
+            lower_dept = dept.lower()
+
+            # Check if the dept is a foreign language course
+            foreign_language_subject = is_foreign_language_course(dept, subject_list, rules)
+            if foreign_language_subject is not None:
+                return foreign_language_subject, 1.0
+
+            # Check for an exact match first
+            if lower_dept in lower_subject_list:
+                logger.debug("Exact match found for the dept %s", dept)
+                return dept.title(), 1.0  # Return the title-cased department name
+
+        # If there's no exact or partial match, take the precomputed best subject of every department and only
+        # search the departments missing from the table (or whose subject is excluded from subject_list)
+        if dept_names:
+            best = dept_subjects.best(dept_names, subject_list)
+            live = [dept for dept in dept_names if dept not in best]
+            if live:
+                for dept, hits in zip(live, engine.search(live, 1, subject_list, embeddings=embeddings)):
+                    if hits:
+                        best[dept] = hits[0]
+            # On a tie the earliest department keeps its subject
+            for dept in dept_names:
+                if dept in best and best[dept][1] > highest_similarity:
+                    matched_subject, highest_similarity = best[dept]
+
+        return matched_subject, highest_similarity
+
+def exclude_subjects(course_title, subjects, rules=None):
+    rules = rules or get_ruleset()
+    # Convert course title to lowercase for case-insensitive comparison, the excluded combinations are already lowercased
     lower_course_title = course_title.lower()
-    lower_excluded_combinations = {k.lower(): v.lower() for k, v in excluded_subjects.items()}
 
     # Remove the excluded subjects from the list if the course title contains a key in excluded_combinations
-    for exclusion_key, exclusion_value in lower_excluded_combinations.items():
+    for exclusion_key, exclusion_value in rules.excluded_subjects:
         if exclusion_key in lower_course_title:
             subjects = [subject for subject in subjects if subject.lower() != exclusion_value]
 
     # Return the filtered list of subjects
     return subjects
 
-# Define function to match subject using course title, course prefix, a list of subjects and a dictionary of abbreviations
-def match_subject_by_title(course_title, course_prefix, university, subject_list, abbreviations, threshold=0.55, debug=False):
-    # Initialise the spell checker
-    spell = Speller(lang='en')
-    course_title = ' '.join([spell(word) for word in course_title.split()])
+# Title that passed every rule without a decision and needs to be scored against the subject embeddings
+class TitleCandidates(object):
+    def __init__(self, subject_list, expanded_titles, excluded_words):
+        self.subject_list = subject_list  # subjects left after exclude_subjects
+        self.expanded_titles = expanded_titles  # abbreviation expansions to score
+        self.excluded_words = excluded_words
+        self.alternatives = []  # ranked (subject, score) pairs, filled in by score_title_match
+
+# Define function to run the rule-based part of match_subject_by_title.
+# Returns ((subject, similarity, decision path), None) when a rule decides, otherwise (None, TitleCandidates).
+def prepare_title_match(course_title, course_prefix, subject_list, abbreviations, dept_names, rules, spell=None, debug=False, embeddings=None):
+    # Spell check the course title
+    if spell is not None:
+        with span('spell_check'):
+            course_title = ' '.join([spell(word) for word in course_title.split()])
     course_title = course_title.title()
     lower_title = course_title.lower()
 
-    predefined_subjects = fetch_predefined_subjects_from_database()
-    science_keywords = fetch_science_keywords_from_database()
-    keyword_to_subject = fetch_keyowrd_subjects_from_database()
-    excluded_words = [word.lower() for word in fetch_excluded_words_from_database()]
-    excluded_titles = fetch_excluded_titles_from_database()
-    dept_names = fetch_dept_abbreviations_from_database(university,course_prefix)
-    # Exclude certain subjects based on the course title
-    subject_list = exclude_subjects(course_title, subject_list)
-
-    # If the course title is in the list of excluded titles, return a special result
-    if course_title.lower() in excluded_titles:
-        return f"Title excluded: {course_title}", 0.0
-  
-    # Calculate embeddings only for the subjects that are not excluded
-    subject_embeddings = torch.stack([get_sentence_embeddings(subject) for subject in subject_list])
-
-    # Check for keyword subjects
-    for keyword, subject in keyword_to_subject.items():
-        if re.search(keyword, lower_title):
-            if debug: print(f'Matched by regex: {subject}')
-            return subject, 1.0
-
-    # First, convert the course title to lowercase and remove excluded words
-    course_title = re.sub(r'\((.*?)\)', r'\1', course_title)
-    course_title = course_title.title()
-    course_title = course_title.replace('/', ' / ')
-    # Course title words converted to lowercase for comparison
-    filtered_title = ' '.join([word for word in course_title.split() if word.lower() not in excluded_words])
+    excluded_words = rules.excluded_words
+    with span('rules'):
+        # Exclude certain subjects based on the course title
+        subject_list = exclude_subjects(course_title, subject_list, rules)
+
+        # If the course title is in the list of excluded titles, return a special result
+        if lower_title in rules.excluded_titles:
+            return (f"Title excluded: {course_title}", 0.0, 'excluded_title'), None
+
+        # Check for keyword subjects
+        subject = rules.keyword_matcher.match(lower_title)
+        if subject is not None:
+            if debug: logger.info('Matched by regex: %s', subject)
+            return (subject, 1.0, 'keyword'), None
+
+        # First, convert the course title to lowercase and remove excluded words
+        course_title = re.sub(r'\((.*?)\)', r'\1', course_title)
+        course_title = course_title.title()
+        course_title = course_title.replace('/', ' / ')
+        # Course title words converted to lowercase for comparison
+        filtered_title = ' '.join([word for word in course_title.split() if word.lower() not in excluded_words])
+
     if not filtered_title:
-        if debug: print('Course title consisted only of excluded words.')
+        if debug: logger.info('Course title consisted only of excluded words.')
         # Match department
-        matched_subject, highest_similarity = match_subject_with_dept(dept_names, subject_list)
-        print(f'After excluding excluded words matched with dept: ',matched_subject)
-        return matched_subject, highest_similarity
-    
-    # Check if the course title and department match a predefined combination
-    for (dept, title), subject in predefined_subjects.items():
-        if dept.lower() == '' and re.search(title, filtered_title.lower()):
-            return subject, 1.0
-
-        elif dept.lower() in [d.lower() for d in dept_names] and re.search(title, filtered_title):
-            return subject, 1.0
-        
-    # If 'Edu' is in the department, categorize courses accordingly
-    if 'Edu' in course_prefix:
-        is_teaching_science = any(keyword in lower_title for keyword in science_keywords)
-        if is_teaching_science:
-            if debug: print(f'Matched by Edu prefix (Teaching Science): Teaching Science')
-            return 'Teaching Science', 1.0
-        else:
-            if debug: print(f'Matched by Edu prefix (Education): Education')
-            return 'Education', 1.0
+        matched_subject, highest_similarity = match_subject_with_dept(dept_names, subject_list, rules, embeddings)
+        logger.debug('After excluding excluded words matched with dept: %s', matched_subject)
+        return (matched_subject, highest_similarity, 'excluded_words_dept'), None
+
+    with span('rules'):
+        # Check if the course title and department match a predefined combination
+        lower_dept_names = [d.lower() for d in dept_names]
+        subject = rules.predefined_matcher.match(filtered_title, lower_dept_names)
+        if subject is not None:
+            return (subject, 1.0, 'predefined'), None
+
+        # If 'Edu' is in the department, categorize courses accordingly
+        if 'Edu' in course_prefix:
+            is_teaching_science = any(keyword in lower_title for keyword in rules.science_keywords)
+            if is_teaching_science:
+                if debug: logger.info('Matched by Edu prefix (Teaching Science): Teaching Science')
+                return ('Teaching Science', 1.0, 'edu'), None
+            else:
+                if debug: logger.info('Matched by Edu prefix (Education): Education')
+                return ('Education', 1.0, 'edu'), None
 
     # Expand course title abbreviations
-    expanded_titles = replace_abbreviations(filtered_title, abbreviations)
+    with span('expansion'):
+        expanded_titles = replace_abbreviations(filtered_title, abbreviations)
 
+    # Check if the course title is a foreign language course
+    with span('rules'):
+        foreign_language_subject = is_foreign_language_course(filtered_title, subject_list, rules)
+    if foreign_language_subject is not None:
+        return (foreign_language_subject, 1.0, 'foreign_language'), None
+
+    # A title (or one of its expansions) that names a subject is decided without the model
+    if config.LEXICAL_MATCH:
+        with span('lexical'):
+            subject = lexical_matcher.exact(expanded_titles, subject_list)
+        if subject is not None:
+            if debug: logger.info('Matched by subject name: %s', subject)
+            return (subject, 1.0, 'lexical'), None
+
+    return None, TitleCandidates(subject_list, expanded_titles, excluded_words)
+
+# Define function to pick the subject from the nearest subjects of each expanded title: one list of
+# (subject, score) pairs per expansion, best first. Returns (subject, similarity, decision path).
+def score_title_match(candidates, hits_per_title, threshold=0.55, debug=False, top_k=3):
+    subject_list = candidates.subject_list
     highest_similarity = -1
     matched_subject = "Special Topics"
+    candidates.alternatives = merge_hits(hits_per_title, top_k)
+    word_matches = None
 
-    # Check if the course title is a foreign language course
-    foreign_language_subject = is_foreign_language_course(filtered_title, subject_list)
-    if foreign_language_subject is not None:
-        return foreign_language_subject, 1.0
- 
-    # Check for predefined subjects using regex patterns
-    for expanded_title in expanded_titles:
-        # Remove excluded words from expanded title
-        lower_title = expanded_title.lower()
-        course_title_embedding = get_sentence_embeddings(expanded_title)
-        # Compute cosine similarity between course title and subjects
-        similarities = torch.nn.functional.cosine_similarity(course_title_embedding, subject_embeddings)
-        
-        index = torch.argmax(similarities)
-        similarity = similarities[index]
-
-        if similarity.item() > highest_similarity:
-            highest_similarity = similarity.item()
-            print(f'Similarity found: ', highest_similarity)
-            matched_subject = subject_list[index]
+    for expanded_title, hits in zip(candidates.expanded_titles, hits_per_title):
+        if hits and hits[0][1] > highest_similarity:
+            matched_subject, highest_similarity = hits[0]
+            logger.debug('Similarity found: %s', highest_similarity)
 
         if highest_similarity < threshold and highest_similarity > 0.50:
             # Check for an exact match after applying all the existing logic
-            for word in expanded_title.split():
-                if word not in excluded_words:
-                    exact_match = get_matching_subject(word, subject_list)
-                    if exact_match is not None and exact_match != matched_subject:
-                        print('Partial match found: ',exact_match)
-                        if debug: print(f'Exact match found: {exact_match}')
-                        return exact_match, 1.0
-        if debug: print(f'Matched by highest_similarity: {matched_subject}')
-
-    return matched_subject, highest_similarity
-# Create a connection pool
-db_pool = psycopg2.pool.SimpleConnectionPool(
-    1,  # minconn
-    10,  # maxconn
-    host=config.DB_HOST,
-    database=config.DB_NAME,
-    user=config.DB_USERNAME,
-    password=config.DB_PASSWORD
-)
-# Function to get connection from the pool
-def fetch_from_database():
-    return db_pool.getconn()
-
-# Function to return connection back to the pool
-def return_to_pool(conn):
-    db_pool.putconn(conn)
-# Function to close the connection pool
-def close_all_conn():
-    psycopg2.pool.SimpleConnectionPool.closeall()
-
-def fetch_university_from_database(university):
-    # Implement your database query here
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT DISTINCT name FROM dept_abbreviations WHERE LOWER(name) LIKE LOWER(%s)", (university+'%',))
-        university = [row[0] for row in cursor.fetchall()]
-        if not university or university == [''] or university is None:
-            raise ValueError('University not found')
-    except Exception as e:
-        print(f"An error occurred while fetching university: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return university
-
-def fetch_course_prefix_from_database(university, course_prefix):
-    # Implement your database query here
-    connection = fetch_from_database()
-
-    # Handle if university or course_prefix is None
-    university = university if university is not None else ''
-    course_prefix = course_prefix if course_prefix is not None else ''
-
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT DISTINCT courses FROM dept_abbreviations WHERE LOWER(name) LIKE LOWER(%s) AND LOWER(courses) LIKE LOWER(%s)", (university+'%', course_prefix+'%'))
-        course_prefixes = [row[0] for row in cursor.fetchall()]
-        # Throw an error if no course prefix is found
-        if not course_prefixes or course_prefixes == [''] or course_prefixes is None:
-            raise ValueError('Course prefix not found')
-    except Exception as e:
-        print(f"An error occurred while fetching course prefix: {e}")
-        raise e
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return course_prefixes
-
-def fetch_course_titles_from_database(university, course_prefix):
-    connection = fetch_from_database()
+            with span('fuzzy'):
+                if word_matches is None:
+                    # Closest subject of every word of every expansion, in one call
+                    word_matches = lexical_matcher.best(fuzzy_words(candidates), subject_list)
+                for word in expanded_title.split():
+                    if word not in candidates.excluded_words:
+                        best_match = word_matches.get(word)
+                        exact_match = best_match[0] if best_match is not None and best_match[1] > 90 else None
+                        if exact_match is not None and exact_match != matched_subject:
+                            logger.debug('Partial match found: %s', exact_match)
+                            if debug: logger.info('Exact match found: %s', exact_match)
+                            return exact_match, 1.0, 'partial_fuzzy'
+        if debug: logger.info('Matched by highest_similarity: %s', matched_subject)
+
+    return matched_subject, highest_similarity, 'embedding'
+
+# Define function to return the words of the expanded titles that score_title_match compares with the subject names
+def fuzzy_words(candidates):
+    return [word for expanded_title in candidates.expanded_titles for word in expanded_title.split() if word not in candidates.excluded_words]
+
+# Define function to tell whether score_title_match will compare the words with the subject names, i.e. whether the
+# best score so far falls between 0.50 and threshold after any of the expanded titles
+def in_fuzzy_band(hits_per_title, threshold=0.55):
+    highest_similarity = -1
+    for hits in hits_per_title:
+        if hits and hits[0][1] > highest_similarity:
+            highest_similarity = hits[0][1]
+        if 0.50 < highest_similarity < threshold:
+            return True
+    return False
 
-    # Handle if university or course_prefix is None
-    university = university if university is not None else ''
-    course_prefix = course_prefix if course_prefix is not None else ''
+# Define function to match subject using course title, course prefix, a list of subjects and a dictionary of abbreviations
+def match_subject_by_title(course_title, course_prefix, university, subject_list, abbreviations, threshold=0.55, debug=False, rules=None, dept_names=None):
+    rules = rules or get_ruleset()
+    with timed_request():
+        if dept_names is None:
+            with span('dept_lookup'):
+                dept_names = dept_index.dept_names(university, course_prefix)
+        # Use the shared spell checker
+        spell = get_spell_corrector()
+
+        result, candidates = prepare_title_match(course_title, course_prefix, subject_list, abbreviations, dept_names, rules, spell, debug)
+        if result is not None:
+            return result[:2]
+
+        # Look up the nearest subjects that are not excluded for every expanded course title in one batch
+        with span('embedding'):
+            hits_per_title = engine.search(candidates.expanded_titles, 3, candidates.subject_list)
+        return score_title_match(candidates, hits_per_title, threshold, debug)[:2]
+# Define function to create the connection pool, on first use so that importing this module doesn't need the
+# database. Statements running longer than DB_STATEMENT_TIMEOUT_MS are cancelled by the server.
+def create_db_pool():
+    options = f'-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}' if config.DB_STATEMENT_TIMEOUT_MS else None
+    return psycopg2.pool.ThreadedConnectionPool(
+        config.DB_POOL_MIN,  # minconn
+        config.DB_POOL_MAX,  # maxconn
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        dbname=config.DB_NAME,
+        user=config.DB_USERNAME,
+        password=config.DB_PASSWORD,
+        connect_timeout=config.DB_CONNECT_TIMEOUT,
+        options=options
+    )
+
+database = Database(create_db_pool, config.DB_POOL_MAX, config.DB_POOL_TIMEOUT)
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT DISTINCT course_title FROM dept_abbreviations WHERE LOWER(name) LIKE LOWER(%s) AND LOWER(courses) LIKE LOWER(%s)", (university+'%', course_prefix+'%'))
-        course_titles = [row[0] for row in cursor.fetchall()]
-        # Throw an error if no course prefix is found
-        if not course_titles or course_titles == [''] or course_titles is None:
-            raise ValueError('Course title not found')
-    except Exception as e:
-        print(f"An error occurred while fetching course_title: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return course_titles
+# Function to close the connection pool
+def close_all_conn():
+    database.close()
+
+# Reference tables read by load_ruleset, with their columns: ruleset table -> (database table, columns)
+REFERENCE_TABLES = {
+    'predefined_subjects': ('predefined_subjects', ['dept', 'course_title', 'subject']),
+    'science_keywords': ('science_keywords', ['science_keyword']),
+    'keyword_subjects': ('keyword_subjects', ['keyword', 'subject']),
+    'excluded_words': ('excluded_words', ['words']),
+    'excluded_titles': ('excluded_titles', ['titles']),
+    'excluded_subjects': ('excluded_subjects', ['titles', 'subjects']),
+    'foreign_language_keywords': ('foreign_language_keywords', ['foreign_languages']),
+    'abbreviations': ('abbreviation', ['abbreviations', 'subject']),
+}
+# Tables whose rows are keyed on their first column; later duplicates win, as they did when the rows were loaded into dicts
+KEYED_TABLES = ('keyword_subjects', 'excluded_subjects', 'abbreviations')
+DEPT_COLUMNS = ['name', 'courses', 'departments', 'course_title']
+
+# Define function to build one statement returning the rows of several queries, each row tagged with the name of
+# its query: name -> (FROM clause, column expressions). The columns are cast to text so the branches line up.
+def tagged_union(queries):
+    width = max(len(columns) for source, columns in queries.values())
+    selects = []
+    for name, (source, columns) in queries.items():
+        values = [f"CAST({column} AS TEXT)" for column in columns] + ['NULL'] * (width - len(columns))
+        selects.append(f"SELECT '{name}', {', '.join(values)} FROM {source}")
+    return '\nUNION ALL\n'.join(selects)
+
+# Read the subject list, the reference tables and the row count of every university in dept_abbreviations (or,
+# with dept_rows, all its rows) in a single round trip to the database
+def fetch_reference_data(dept_rows=False):
+    queries = dict(REFERENCE_TABLES)
+    queries['subjects'] = ('subjects', ['subject_list'])
+    queries['dept_row_counts'] = ('dept_abbreviations GROUP BY LOWER(name)', ['LOWER(name)', 'COUNT(*)'])
+    if dept_rows:
+        queries['dept_abbreviations'] = ('dept_abbreviations', DEPT_COLUMNS)
+    rows = {name: [] for name in queries}
+    for row in database.query(tagged_union(queries)):
+        name = row[0]
+        rows[name].append(tuple(row[1:1 + len(queries[name][1])]))
+
+    data = {name: [row[0] for row in rows[name]] if len(queries[name][1]) == 1 else rows[name] for name in queries}
+    for name in KEYED_TABLES:
+        data[name] = list(dict(data[name]).items())
+    data['abbreviations'] = dict(data['abbreviations'])
+    data['dept_row_counts'] = {(name or ''): int(count) for name, count in data['dept_row_counts']}
+    return data
 
 def fetch_subject_list_from_database():
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT subject_list FROM subjects")
-
-        subject_list = [row[0] for row in cursor.fetchall()]
-    except Exception as e:
-        print(f"An error occurred while fetching subject_list: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return subject_list
-
-def fetch_dept_abbreviations_from_database(university,course_prefix):
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        # Using ILIKE with a wildcard character (%) to match courses that start with the course_prefix
-        cursor.execute("SELECT DISTINCT departments FROM dept_abbreviations WHERE LOWER(name) LIKE LOWER(%s) AND LOWER(courses) LIKE LOWER(%s)", ('%'+university+'%', '%'+course_prefix+'%'))
-        dept_abbreviations = [row[0] for row in cursor.fetchall()]  # Create a dictionary from the fetched rows
-    except Exception as e:
-        print(f"An error occurred while fetching dept_abbreviations: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return dept_abbreviations
-
-def fetch_excluded_subjects_from_database():
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT titles,subjects FROM excluded_subjects")  # Update the SQL query to fetch both keyword and subject
-        excluded_subjects = {row[0]: row[1] for row in cursor.fetchall()}  # Create a dictionary from the fetched rows
-    except Exception as e:
-        print(f"An error occurred while fetching excluded_subjects: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return excluded_subjects
-
-def fetch_keyowrd_subjects_from_database():
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT keyword, subject FROM keyword_subjects")  # Update the SQL query to fetch both keyword and subject
-        keyword_subjects = {row[0]: row[1] for row in cursor.fetchall()}  # Create a dictionary from the fetched rows
-    except Exception as e:
-        print(f"An error occurred while fetching keyword_subjects: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return keyword_subjects
-
-def fetch_predefined_subjects_from_database():
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT dept, course_title, subject FROM predefined_subjects")  # Update the SQL query to fetch both keyword and subject
-        predefined_subjects = {(row[0], re.compile(r'(?i)' + row[1])): row[2] for row in cursor.fetchall()}
-    except Exception as e:
-        print(f"An error occurred while fetching predefined_subjects: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return predefined_subjects
-
-def fetch_foreign_language_from_database():
-    connection = fetch_from_database()
+    return [row[0] for row in database.query("SELECT subject_list FROM subjects")]
+
+def fetch_all_dept_abbreviations_from_database(universities=None):
+    if universities is None:
+        rows = database.query("SELECT name, courses, departments, course_title FROM dept_abbreviations")
+    else:
+        # Only the rows of the given universities, for an incremental refresh of the index
+        rows = database.query("SELECT name, courses, departments, course_title FROM dept_abbreviations WHERE LOWER(name) IN (%s)"
+                              % ', '.join(['%s'] * len(universities)), [university.lower() for university in universities])
+    return [(row[0], row[1], row[2], row[3]) for row in rows]
+
+def fetch_dept_row_counts_from_database():
+    return {(row[0] or ''): row[1] for row in database.query("SELECT LOWER(name), COUNT(*) FROM dept_abbreviations GROUP BY LOWER(name)")}
+
+# Re-read the subjects table and re-encode the subjects only if the list has changed
+def refresh_subject_list(subjects=None):
+    global subject_list
+    subject_list = fetch_subject_list_from_database() if subjects is None else subjects
+    changed = subject_store.build(subject_list)
+    lexical_matcher.update(subject_list, subject_store.fingerprint)
+    return changed
+
+# Load every reference table into a new ruleset in one go, or build it from the raw rows of a snapshot
+def load_ruleset(tables=None, load_time=None):
+    start_time = time.time()
+    if tables is None:
+        data = fetch_reference_data()
+        tables = {name: data[name] for name in REFERENCE_TABLES}
+    if load_time is None:
+        load_time = time.time() - start_time
+    return build_ruleset(load_time=load_time, max_expansions=config.MAX_EXPANSIONS, **tables)
+
+# Reload the subject list and the reference tables, then swap the new ruleset in (caller holds _reload_lock)
+def _swap_ruleset(universities=()):
+    start_time = time.time()
+    data = fetch_reference_data(dept_rows=dept_index.version is None)
+    load_time = time.time() - start_time
+    refresh_subject_list(data['subjects'])
+    refresh_dept_index(universities, data['dept_row_counts'], data.get('dept_abbreviations'))
+    refresh_dept_subjects()
+    rules = load_ruleset({name: data[name] for name in REFERENCE_TABLES}, load_time)
+    _install_ruleset(rules)
+    if config.SNAPSHOT_DIR:
+        save_startup_snapshot(rules)
+    return rules
+
+def _install_ruleset(rules):
+    global reference_rules, abbreviations
+    reference_rules = rules
+    abbreviations = rules.abbreviations
+    # Never spell-correct subject names, abbreviations or department names
+    if spell_corrector is not None:
+        spell_corrector.set_whitelist(domain_whitelist(rules))
+
+# Save the subjects, their embeddings, the reference tables and the department index for the next worker to start
+# from; nothing is written when the data is the same as in the snapshot this worker loaded or saved last
+def save_startup_snapshot(rules):
+    global _snapshot_key
+    snapshot = subject_store.current()
+    key = [snapshot.fingerprint, rules.version, dept_index.version, dept_subjects.fingerprint]
+    if snapshot.vectors is None or key == _snapshot_key:
+        return False
     try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT foreign_languages FROM foreign_language_keywords")
-        foreign_language_subject = [row[0] for row in cursor.fetchall()]
+        save_snapshot(config.SNAPSHOT_DIR, ENCODER_ID, snapshot.subjects, snapshot.fingerprint, snapshot.vectors,
+                      rules.tables, rules.version, dept_index.dump(), dept_index.version, dept_subjects.dump())
     except Exception as e:
-        print(f"An error occurred while fetching foreign_language_keywords: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool 
-    return foreign_language_subject
-
-def fetch_abbreviations_from_database():
-    connection = fetch_from_database()  
+        logger.error("An error occurred while saving the startup snapshot to %s: %s", config.SNAPSHOT_DIR, e)
+        return False
+    _snapshot_key = key
+    return True
+
+# Load the subjects, their embeddings, the reference tables and the department index from the startup snapshot,
+# without the database or the model. Returns False when there is no usable snapshot.
+def restore_startup_snapshot():
+    global subject_list, _snapshot_key
+    snapshot = load_snapshot(config.SNAPSHOT_DIR, ENCODER_ID, config.EMBEDDING_DTYPE)
+    if snapshot is None:
+        return False
+    with _reload_lock:
+        subject_store.install(snapshot.subjects, snapshot.vectors, snapshot.fingerprint)
+        subject_list = subject_store.subjects
+        lexical_matcher.update(subject_list, subject_store.fingerprint)
+        dept_index.restore(snapshot.dept_index)
+        dept_subjects.restore(snapshot.dept_subjects, subject_list, subject_store.fingerprint)
+        _install_ruleset(load_ruleset(snapshot.tables))
+        _snapshot_key = snapshot.key
+    return True
+
+# Define function to build the spell-check whitelist from the subjects, abbreviations and department names
+def domain_whitelist(rules):
+    return whitelist_words(subject_list or [], rules.abbreviations.keys(), dept_index.departments())
+
+# Return the process-wide spell corrector, loading the dictionary on first use
+def get_spell_corrector():
+    global spell_corrector
+    if spell_corrector is None:
+        with _spell_lock:
+            if spell_corrector is None:
+                corrector = SpellCorrector(cache_size=config.SPELL_CACHE_SIZE)
+                if reference_rules is not None:
+                    corrector.set_whitelist(domain_whitelist(reference_rules))
+                spell_corrector = corrector
+    return spell_corrector
+
+def reload_ruleset(universities=()):
+    with _reload_lock:
+        return _swap_ruleset(universities)
+
+# Load the department index, or refresh it incrementally: only universities whose row count changed, plus the
+# universities passed explicitly (e.g. after rows were edited in place), are re-read from dept_abbreviations.
+# The row counts, or all the rows on the first load, may be passed in when they were read with the other tables.
+def refresh_dept_index(universities=(), row_counts=None, rows=None):
+    if dept_index.version is None:
+        dept_index.load(fetch_all_dept_abbreviations_from_database() if rows is None else rows)
+        return len(dept_index.universities)
+    if row_counts is None:
+        row_counts = fetch_dept_row_counts_from_database()
+    indexed_counts = dept_index.row_counts()
+    changed = {name for name, count in row_counts.items() if indexed_counts.get(name) != count}
+    changed.update(university.lower() for university in universities if university.lower() in row_counts)
+    removed = [name for name in indexed_counts if name not in row_counts]
+    if changed or removed:
+        rows = fetch_all_dept_abbreviations_from_database(sorted(changed)) if changed else []
+        dept_index.update(rows, removed)
+    return len(changed) + len(removed)
+
+# Bring the department -> subject table in line with the department index and the subject list; only new
+# departments and, when the subjects changed, the added subjects are searched
+def refresh_dept_subjects():
+    return dept_subjects.refresh(dept_index.departments(), subject_list, subject_store.fingerprint)
+
+# Return the current ruleset. Once it is older than RULESET_TTL a background thread reloads it, and requests
+# keep using the current snapshot meanwhile, so no request waits on the database for reference data.
+def get_ruleset():
+    rules = reference_rules
+    if rules is None:
+        return reload_ruleset()
+    if config.RULESET_TTL and rules.age() > config.RULESET_TTL and _reload_lock.acquire(blocking=False):
+        threading.Thread(target=_background_reload, args=(rules,), name='ruleset-reload', daemon=True).start()
+    return rules
+
+def _background_reload(rules):
     try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT abbreviations,subject FROM abbreviation")
-        abbreviations = {row[0]: row[1] for row in cursor.fetchall()}  # Create a dictionary from the fetched rows
+        _swap_ruleset()
     except Exception as e:
-        print(f"An error occurred while fetching abbreviation: {e}")
+        logger.error("An error occurred while reloading the ruleset, keeping version %s: %s", rules.version, e)
     finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return abbreviations
-
-def fetch_excluded_words_from_database():
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT words FROM excluded_words")
-        excluded_words = [row[0] for row in cursor.fetchall()]
-    except Exception as e:
-        print(f"An error occurred while fetching excluded_words: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return excluded_words
-def fetch_excluded_titles_from_database():
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT titles FROM excluded_titles")
-        excluded_titles = [row[0] for row in cursor.fetchall()]
-    except Exception as e:
-        print(f"An error occurred while fetching excluded_titles: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return excluded_titles
-def fetch_science_keywords_from_database():
-    connection = fetch_from_database()
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT science_keyword FROM science_keywords")
-        science_keywords = [row[0] for row in cursor.fetchall()]
-    except Exception as e:
-        print(f"An error occurred while fetching science_keywords: {e}")
-    finally:
-        cursor.close()  # close the cursor
-        return_to_pool(connection)  # return the connection to the pool
-    return science_keywords
+        _reload_lock.release()
 
 def setup():
-    global subject_list, abbreviations
-    # Fetch the data from the database
-    subject_list = fetch_subject_list_from_database()
-    abbreviations = fetch_abbreviations_from_database()
+    start_time = time.time()
+    if config.SNAPSHOT_DIR and restore_startup_snapshot():
+        startup_info['source'] = 'snapshot'
+        # Serve from the snapshot right away and catch up with the database in the background
+        if _reload_lock.acquire(blocking=False):
+            threading.Thread(target=_background_reload, args=(reference_rules,), name='ruleset-reload', daemon=True).start()
+    else:
+        startup_info['source'] = 'database'
+        # Fetch the data from the database
+        reload_ruleset()
+    # Load the spell-check dictionary once at startup rather than on the first request
+    get_spell_corrector()
+    warm_up()
+    startup_info['startup_time'] = time.time() - start_time
+    ready.set()
+
+# Define function to load the model and run a first encode, so the first request doesn't pay for either
+def warm_up():
+    start_time = time.time()
+    load_model()
+    get_sentence_embeddings(['Introduction to Biology'])
+    startup_info['warm_up_time'] = time.time() - start_time
+
+# Return whether setup() has finished, with where the reference data came from and how long startup took
+def readiness():
+    return dict(startup_info, ready=ready.is_set(), ruleset_version=reference_rules.version if reference_rules is not None else None,
+                subjects=len(subject_store.subjects))
 
 def main(course_prefix, course_title, university):
-    global subject_list, abbreviations
-    
-    # Fetch department names from the database
-    fetched_dept_names = fetch_dept_abbreviations_from_database(university, course_prefix)
+    result = match_course(course_prefix, course_title, university)
+    return result['course_subject'], result['similarity_rate'], result['department_abbreviations']
+
+# Define function to match a single course; returns the same fields as main() plus the match method
+# and the top-k alternatives ranked by the semantic similarity of the course title
+def match_course(course_prefix, course_title, university, top_k=3):
+    with timed_request():
+        return _match_course(course_prefix, course_title, university, top_k)
+
+def _match_course(course_prefix, course_title, university, top_k):
+    rules = get_ruleset()
+
+    # Serve repeated lookups from the result cache
+    version = cache_version(rules)
+    key = cache_key(university, course_prefix, course_title, top_k, True)
+    with span('cache_lookup'):
+        cached = result_cache.get(key, version) if result_cache.enabled else None
+    if cached is not None:
+        decisions.inc('cache')
+        return cached
+
+    # Look up department names in the ruleset
+    with span('dept_lookup'):
+        fetched_dept_names = dept_index.dept_names(university, course_prefix)
 
     # Use fetched department for matching
-    subject, similarity_rate_title = match_subject_by_title(course_title, course_prefix, university, subject_list, abbreviations)
-
+    result, candidates = prepare_title_match(course_title, course_prefix, subject_list, rules.expander, fetched_dept_names, rules, get_spell_corrector())
+    if result is None:
+        with span('embedding'):
+            hits_per_title = engine.search(candidates.expanded_titles, max(top_k, 1), candidates.subject_list)
+        result = score_title_match(candidates, hits_per_title, top_k=top_k)
+
+    result = resolve_subject(course_title, result[0], result[1], fetched_dept_names, subject_list, rules, candidates=candidates, decision=result[2])
+    if result_cache.enabled:
+        result_cache.set(key, version, result)
+    return result
+
+# Define function to return the version of the reference data a cached result depends on
+def cache_version(rules):
+    return f"{rules.version}:{(subject_store.fingerprint or '')[:12]}:{dept_index.version}"
+
+# Define function to build the result cache key; the options that change the result are part of it
+def cache_key(university, course_prefix, course_title, top_k, spell_check):
+    return normalize_key(university, course_prefix, course_title, spell_check) + (f'top{top_k}', 'spell' if spell_check else 'nospell')
+
+# Define function to fall back to the department names when the title match is not similar enough
+def resolve_subject(course_title, subject, similarity_rate_title, fetched_dept_names, subject_list, rules, embeddings=None, candidates=None, decision='embedding'):
     output_subject = subject
     similarity_rate = similarity_rate_title
     match_method = "Title"
 
     # Try the department name-based method only if the title did not match with a high enough similarity rate
     if similarity_rate_title < 0.55:
-        output_subject, similarity_rate_dept  = match_subject_with_dept(fetched_dept_names, subject_list)
+        output_subject, similarity_rate_dept  = match_subject_with_dept(fetched_dept_names, subject_list, rules, embeddings)
 
         # If the highest similarity rate from department name match is still less than 0.55, then the subject should be set to "Special Topics"
         if similarity_rate_dept  < 0.50:
             output_subject = "Special Topics"
+            decision = 'special_topics'
+        else:
+            decision = 'dept'
 
         similarity_rate = similarity_rate_dept 
         match_method = "Dept"
 
-    print(f"The course subject for course_title:{course_title} is {output_subject} with a similarity rate of {similarity_rate:.2f}. Matched with {match_method}. Dept:{output_subject} Title:{subject},{similarity_rate_title}")
-
-    return output_subject, similarity_rate, fetched_dept_names[:5]
-
-atexit.register(db_pool.closeall)
+    decisions.inc(decision)
+    logger.debug("The course subject for course_title:%s is %s with a similarity rate of %.2f. Matched with %s (%s). Dept:%s Title:%s,%s",
+                 course_title, output_subject, similarity_rate, match_method, decision, output_subject, subject, similarity_rate_title)
+
+    return {
+        'course_subject': output_subject,
+        'similarity_rate': similarity_rate,
+        'department_abbreviations': fetched_dept_names[:5],
+        'match_method': match_method,
+        'alternatives': [{'subject': alternative, 'score': score}
+                         for alternative, score in (candidates.alternatives if candidates is not None else [])],
+    }
+
+# Define function to classify many (university, course_prefix, course_title) rows at once.
+# Department lookups are grouped per university/prefix, and every title expansion is encoded
+# in large batches and scored with a single matrix multiply against the subject matrix.
+def classify_batch(courses, spell_check=None, batch_size=256, top_k=3):
+    with timed_request('batch'):
+        return _classify_batch(courses, spell_check, batch_size, top_k)
+
+def _classify_batch(courses, spell_check, batch_size, top_k):
+    rules = get_ruleset()
+    if spell_check is None:
+        spell_check = config.BATCH_SPELL_CHECK
+    subjects = subject_list
+    all_courses = list(courses)
+
+    # Serve repeated courses from the result cache and only classify the misses
+    version = cache_version(rules)
+    keys = [cache_key(university, course_prefix, course_title, top_k, spell_check)
+            for university, course_prefix, course_title in all_courses]
+    with span('cache_lookup'):
+        cached_results = [result_cache.get(key, version) if result_cache.enabled else None for key in keys]
+    courses = [course for course, cached in zip(all_courses, cached_results) if cached is None]
+    decisions.inc('cache', amount=len(all_courses) - len(courses))
+
+    # Department names only depend on the university and the prefix
+    dept_names_by_key = {}
+    with span('dept_lookup'):
+        for university, course_prefix, course_title in courses:
+            if (university, course_prefix) not in dept_names_by_key:
+                dept_names_by_key[(university, course_prefix)] = dept_index.dept_names(university, course_prefix)
+
+    # Encode every distinct department name without a precomputed subject once for the department fallback
+    dept_texts = list(dict.fromkeys(dept for dept_names in dept_names_by_key.values() for dept in dept_names if dept not in dept_subjects))
+    with span('dept_encode'):
+        dept_embeddings = dict(zip(dept_texts, engine.encode(dept_texts, batch_size))) if dept_texts else {}
+
+    # Run the rule-based stages and collect the distinct expanded titles that still need scoring
+    spell = get_spell_corrector() if spell_check else None
+    prepared = []
+    query_rows = {}
+    for university, course_prefix, course_title in courses:
+        dept_names = dept_names_by_key[(university, course_prefix)]
+        result, candidates = prepare_title_match(course_title, course_prefix, subjects, rules.expander, dept_names, rules, spell, embeddings=dept_embeddings)
+        if candidates is not None:
+            for expanded_title in candidates.expanded_titles:
+                query_rows.setdefault(expanded_title, len(query_rows))
+        prepared.append((course_title, dept_names, result, candidates))
+
+    # Encode all expanded titles in one go and look up their nearest subjects in one index search
+    query_embeddings = {}
+    hits_by_title = {}
+    if query_rows:
+        with span('embedding'):
+            queries = list(query_rows)
+            query_embeddings = dict(zip(queries, engine.encode(queries, batch_size)))
+            hits_by_title = dict(zip(queries, engine.search(queries, max(top_k, 1), subjects, embeddings=query_embeddings)))
+
+    hits = []
+    band_words = []
+    for course_title, dept_names, result, candidates in prepared:
+        hits_per_title = None
+        if result is None:
+            if candidates.subject_list is subjects:
+                hits_per_title = [hits_by_title[expanded_title] for expanded_title in candidates.expanded_titles]
+            else:
+                # Some subjects were excluded for this title; search again without them, reusing the embeddings
+                hits_per_title = engine.search(candidates.expanded_titles, max(top_k, 1), candidates.subject_list, embeddings=query_embeddings)
+            if in_fuzzy_band(hits_per_title):
+                band_words.extend(fuzzy_words(candidates))
+        hits.append(hits_per_title)
+
+    # Look up the closest subject of the words of every title in the fuzzy band at once, to fill the token cache
+    if band_words:
+        with span('fuzzy'):
+            lexical_matcher.best(band_words, subjects)
+
+    results = []
+    for (course_title, dept_names, result, candidates), hits_per_title in zip(prepared, hits):
+        if result is None:
+            result = score_title_match(candidates, hits_per_title, top_k=top_k)
+        results.append(resolve_subject(course_title, result[0], result[1], dept_names, subjects, rules, dept_embeddings, candidates, result[2]))
+
+    # Merge the new results back in input order
+    new_results = iter(results)
+    for index, cached in enumerate(cached_results):
+        if cached is None:
+            cached_results[index] = next(new_results)
+            if result_cache.enabled:
+                result_cache.set(keys[index], version, cached_results[index])
+    return cached_results
+
+atexit.register(close_all_conn)
+
+# Counters kept by the result cache and the micro-batcher, reported on /metrics
+registry.callback('course_subject_cache_hits_total', 'Result cache hits', lambda: result_cache.hits, 'counter')
+registry.callback('course_subject_cache_misses_total', 'Result cache misses', lambda: result_cache.misses, 'counter')
+registry.callback('course_subject_encode_batches_total', 'Model calls made by the encode micro-batcher',
+                  lambda: encode_batcher.batches if encode_batcher is not None else 0, 'counter')
+registry.callback('course_subject_encode_requests_total', 'Encode calls merged by the micro-batcher',
+                  lambda: encode_batcher.requests if encode_batcher is not None else 0, 'counter')
+registry.callback('course_subject_ruleset_age_seconds', 'Seconds since the reference data was loaded',
+                  lambda: reference_rules.age() if reference_rules is not None else 0)
+registry.callback('course_subject_dept_table_hits_total', 'Department fallbacks answered from the precomputed table',
+                  lambda: dept_subjects.hits, 'counter')
+registry.callback('course_subject_dept_table_misses_total', 'Department fallbacks searched live',
+                  lambda: dept_subjects.misses, 'counter')
+registry.callback('course_subject_expansions_total', 'Abbreviation expansions of course titles generated for scoring',
+                  lambda: expansion_stats()['candidates'], 'counter')
+registry.callback('course_subject_expansion_cap_hits_total', 'Course titles whose abbreviation expansions were cut off at MAX_EXPANSIONS',
+                  lambda: expansion_stats()['cap_hits'], 'counter')
+registry.callback('course_subject_lexical_words_total', 'Title words compared with the subject names by RapidFuzz',
+                  lambda: lexical_matcher.lookups, 'counter')
+registry.callback('course_subject_lexical_word_cache_hits_total', 'Title words whose closest subject came from the token cache',
+                  lambda: lexical_matcher.cached, 'counter')
+registry.callback('course_subject_ready', 'Whether setup() has finished', lambda: int(ready.is_set()))
+registry.callback('course_subject_db_connections_in_use', 'Database connections checked out of the pool', lambda: database.in_use)
+registry.callback('course_subject_db_connections_max', 'Upper bound on the database connections of the pool', lambda: database.max_connections)
 
 if __name__ == "__main__":
+    configure_logging()
     setup()
     while True:  # Keep the application running until it's manually stopped
         university = input("University: ") 
         course_prefix = input("Course Prefix: ")
         course_title = input("Course Title: ")
-        main(course_prefix, course_title, university)
+        course_subject, similarity_rate, dept_names = main(course_prefix, course_title, university)
+        print(f"The course subject for course_title:{course_title} is {course_subject} with a similarity rate of {similarity_rate:.2f}. Dept:{dept_names}")
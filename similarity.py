@@ -0,0 +1,58 @@
+import torch
+
+
+# Define function to turn a (queries x subjects) similarity matrix into the k best (subject, score) pairs,
+# taking the best score of each subject over all the queries (e.g. all abbreviation expansions of a title)
+def rank(similarities, subjects, k=3):
+    if similarities.dim() == 2:
+        similarities = similarities.max(dim=0).values
+    k = min(k, len(subjects))
+    if k <= 0:
+        return []
+    scores, indices = torch.topk(similarities, k)
+    return [(subjects[index], score) for index, score in zip(indices.tolist(), scores.tolist())]
+
+
+# Define function to merge the (subject, score) hits of several queries into the k best subjects,
+# taking the best score of each subject over all the queries, like rank() does for a similarity matrix
+def merge_hits(hits_per_query, k=3):
+    best = {}
+    for hits in hits_per_query:
+        for subject, score in hits:
+            if score > best.get(subject, float('-inf')):
+                best[subject] = score
+    return sorted(best.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+# Scoring engine shared by the title, department and batch paths: queries are encoded in one batch,
+# normalised, and searched against the pre-normalised subject vectors of the store's vector index
+class SimilarityEngine(object):
+    def __init__(self, store, encode):
+        self.store = store
+        self._encode = encode
+
+    # Return the unit-length embeddings of the queries, reusing precomputed ones from embeddings (text -> vector)
+    def encode(self, queries, batch_size=256, embeddings=None):
+        embeddings = embeddings or {}
+        missing = list(dict.fromkeys(query for query in queries if query not in embeddings))
+        if missing:
+            encoded = torch.nn.functional.normalize(self._encode(missing, batch_size), dim=1)
+            embeddings = dict(embeddings, **dict(zip(missing, encoded)))
+        return torch.stack([embeddings[query] for query in queries])
+
+    # Return the k best (subject, score) pairs of every query among the subjects (all stored subjects by default),
+    # sorted by score, from the snapshot's vector index. Subjects left out of a filtered list are skipped by the
+    # index search rather than by rebuilding it.
+    def search(self, queries, k=1, subjects=None, batch_size=256, embeddings=None):
+        snapshot = self.store.current()
+        query_embeddings = self.encode(queries, batch_size, embeddings)
+        try:
+            excluded = snapshot.excluded_positions(subjects)
+        except KeyError:
+            # Subjects missing from the store (the subject list is being refreshed), score them directly
+            subject_embeddings = torch.nn.functional.normalize(self.store.rows(subjects), dim=1)
+            return [rank(row, subjects, k) for row in query_embeddings @ subject_embeddings.T]
+        if snapshot.vector_index is None:
+            return [[] for _ in queries]
+        return [[(snapshot.subjects[position], score) for position, score in hits]
+                for hits in snapshot.vector_index.search(query_embeddings, k, excluded)]
@@ -0,0 +1,134 @@
+import glob
+import json
+import logging
+import os
+import tempfile
+import time
+import numpy as np
+import torch
+from quantization import SubjectVectors
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout of the files below changes, so older snapshots are ignored
+FORMAT = 2
+MANIFEST = 'manifest.json'
+
+
+# Reference data of a worker saved to disk, so a new worker can start from it instead of the database and the model:
+#   manifest.json              model name, subject list, raw reference tables, the department index and the
+#                              department -> subject table
+#   subjects-<fp>-<dtype>.npy  unit-length subject embeddings in their stored dtype, memory-mapped (copy-on-write)
+#                              when loaded, so workers on the same host share the pages
+#   subjects-<fp>-scales.npy   per-row scales of int8 embeddings
+class StartupSnapshot(object):
+    def __init__(self, manifest, embeddings, scales=None):
+        self.manifest = manifest
+        self.embeddings = embeddings  # numpy array (subjects x dimensions)
+        self.scales = scales  # numpy array (subjects,) for int8 embeddings, None otherwise
+
+    # The embeddings as SubjectVectors, sharing memory with the mapped files
+    @property
+    def vectors(self):
+        return SubjectVectors(torch.from_numpy(self.embeddings), torch.from_numpy(self.scales) if self.scales is not None else None)
+
+    @property
+    def subjects(self):
+        return self.manifest['subjects']
+
+    @property
+    def fingerprint(self):
+        return self.manifest['fingerprint']
+
+    @property
+    def tables(self):
+        return self.manifest['tables']
+
+    @property
+    def dept_index(self):
+        return self.manifest['dept_index']
+
+    @property
+    def dept_subjects(self):
+        return self.manifest.get('dept_subjects')
+
+    # Key of the data in the snapshot, to tell whether a reload changed anything worth saving again
+    @property
+    def key(self):
+        return [self.manifest['fingerprint'], self.manifest['ruleset_version'], self.manifest['dept_index_version'],
+                (self.dept_subjects or {}).get('fingerprint')]
+
+
+# Define function to write data to path atomically, so concurrent workers never read a half-written file
+def _write_atomic(path, write):
+    directory = os.path.dirname(path)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            write(stream)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+# Define function to save a snapshot of the subject vectors; the embeddings files are written before the manifest
+# that points to them
+def save_snapshot(directory, model_name, subjects, fingerprint, vectors, tables, ruleset_version, dept_index, dept_index_version,
+                  dept_subjects=None):
+    os.makedirs(directory, exist_ok=True)
+    embeddings_file = f'subjects-{fingerprint[:12]}-{vectors.dtype}.npy'
+    embeddings = np.ascontiguousarray(vectors.data.cpu().numpy())
+    _write_atomic(os.path.join(directory, embeddings_file), lambda stream: np.save(stream, embeddings))
+    scales_file = None
+    if vectors.scales is not None:
+        scales_file = f'subjects-{fingerprint[:12]}-scales.npy'
+        scales = np.ascontiguousarray(vectors.scales.cpu().numpy(), dtype=np.float32)
+        _write_atomic(os.path.join(directory, scales_file), lambda stream: np.save(stream, scales))
+    manifest = {
+        'format': FORMAT,
+        'model': model_name,
+        'created_at': time.time(),
+        'fingerprint': fingerprint,
+        'subjects': list(subjects),
+        'embeddings': embeddings_file,
+        'embeddings_dtype': vectors.dtype,
+        'scales': scales_file,
+        'ruleset_version': ruleset_version,
+        'tables': tables,
+        'dept_index_version': dept_index_version,
+        'dept_index': dept_index,
+        'dept_subjects': dept_subjects,
+    }
+    _write_atomic(os.path.join(directory, MANIFEST), lambda stream: stream.write(json.dumps(manifest).encode('utf-8')))
+    # Remove the embeddings of older subject lists; workers that mapped them keep their mapping
+    for path in glob.glob(os.path.join(directory, 'subjects-*.npy')):
+        if os.path.basename(path) not in (embeddings_file, scales_file):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+# Define function to load the snapshot in directory; returns None when there is none or it doesn't fit this model
+# and embedding dtype
+def load_snapshot(directory, model_name, dtype='float32'):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as stream:
+            manifest = json.load(stream)
+        if manifest.get('format') != FORMAT or manifest.get('model') != model_name:
+            return None
+        if manifest.get('embeddings_dtype') != dtype:
+            logger.info("Ignoring the startup snapshot in %s: embeddings are %s, not %s", directory, manifest.get('embeddings_dtype'), dtype)
+            return None
+        embeddings = np.load(os.path.join(directory, manifest['embeddings']), mmap_mode='c')
+        scales = np.load(os.path.join(directory, manifest['scales']), mmap_mode='c') if manifest.get('scales') else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error("An error occurred while loading the startup snapshot from %s: %s", directory, e)
+        return None
+    if embeddings.ndim != 2 or embeddings.shape[0] != len(manifest['subjects']) or (scales is not None and scales.shape[0] != embeddings.shape[0]):
+        logger.warning("Ignoring the startup snapshot in %s: embeddings don't match the subject list", directory)
+        return None
+    return StartupSnapshot(manifest, embeddings, scales)
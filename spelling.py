@@ -0,0 +1,38 @@
+import functools
+import string
+from autocorrect import Speller
+
+# Characters stripped from a token before it is looked up in the whitelist
+_TOKEN_PUNCTUATION = string.punctuation + ' '
+
+
+# Define function to collect the lowercased words of a list of names (subjects, departments, abbreviations)
+def whitelist_words(*name_lists):
+    words = set()
+    for names in name_lists:
+        for name in names:
+            words.update(word.strip(_TOKEN_PUNCTUATION).lower() for word in (name or '').split())
+    words.discard('')
+    return frozenset(words)
+
+
+# Spell corrector built once per process. Corrections are memoised per token, and words from the domain
+# whitelist (subjects, abbreviations, department names) are returned unchanged without a dictionary lookup.
+class SpellCorrector(object):
+    def __init__(self, whitelist=frozenset(), cache_size=50000, lang='en'):
+        # Loading the word-frequency dictionary is the expensive part, so it happens only here
+        self.speller = Speller(lang=lang)
+        self.whitelist = frozenset(whitelist)
+        self._correct = functools.lru_cache(maxsize=cache_size)(self.speller)
+
+    # Swap in a new whitelist after the subjects or the reference tables were reloaded
+    def set_whitelist(self, whitelist):
+        self.whitelist = frozenset(whitelist)
+
+    def __call__(self, word):
+        if word.strip(_TOKEN_PUNCTUATION).lower() in self.whitelist:
+            return word
+        return self._correct(word)
+
+    def cache_info(self):
+        return self._correct.cache_info()
@@ -0,0 +1,135 @@
+import math
+import torch
+
+
+# Define function to build the boolean mask of positions to skip, from a tensor/list of excluded positions
+def _excluded_mask(size, exclude):
+    if exclude is None or len(exclude) == 0:
+        return None
+    mask = torch.zeros(size, dtype=torch.bool)
+    mask[torch.as_tensor(exclude, dtype=torch.long)] = True
+    return mask
+
+
+# Exhaustive cosine search over every subject: one matrix multiply, exact results.
+# Indexes are built over SubjectVectors, the unit-length subject embeddings in their stored representation.
+class ExactIndex(object):
+    kind = 'exact'
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    # Return, for every query row, the k best (position, score) pairs; excluded positions are never returned
+    def search(self, queries, k, exclude=None):
+        similarities = self.vectors.scores(queries)
+        mask = _excluded_mask(len(self), exclude)
+        if mask is not None:
+            similarities = similarities.masked_fill(mask, float('-inf'))
+        k = min(k, len(self) - (int(mask.sum()) if mask is not None else 0))
+        if k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        scores, positions = torch.topk(similarities, k, dim=1)
+        return [list(zip(row_positions, row_scores)) for row_positions, row_scores in zip(positions.tolist(), scores.tolist())]
+
+
+# Inverted-file index: the subjects are clustered with spherical k-means, and a query is only scored against the
+# subjects of its nprobe closest clusters. nprobe is the recall/latency setting; nprobe = nlist is exact.
+class IVFIndex(object):
+    kind = 'ivf'
+
+    def __init__(self, vectors, nlist=0, nprobe=8, iterations=10, seed=0):
+        self.vectors = vectors
+        size = len(vectors)
+        self.nlist = max(1, min(size, nlist or int(math.sqrt(size))))
+        self.nprobe = max(1, min(nprobe, self.nlist))
+        # Clustering works on float32 rows; they are only needed while the index is built
+        normalized = vectors.take()
+        self.centroids = self._train(normalized, self.nlist, iterations, seed)
+        assignments = torch.argmax(normalized @ self.centroids.T, dim=1)
+        # Positions sorted by cluster; the subjects of cluster c are order[offsets[c]:offsets[c + 1]]
+        self.order = torch.argsort(assignments, stable=True)
+        counts = torch.bincount(assignments, minlength=self.nlist)
+        self.offsets = [0] + torch.cumsum(counts, dim=0).tolist()
+
+    @staticmethod
+    def _train(vectors, nlist, iterations, seed):
+        generator = torch.Generator().manual_seed(seed)
+        centroids = vectors[torch.randperm(vectors.shape[0], generator=generator)[:nlist]].clone()
+        for _ in range(iterations):
+            assignments = torch.argmax(vectors @ centroids.T, dim=1)
+            sums = torch.zeros_like(centroids).index_add_(0, assignments, vectors)
+            counts = torch.bincount(assignments, minlength=nlist)
+            # Empty clusters keep their previous centroid
+            sums[counts == 0] = centroids[counts == 0]
+            centroids = torch.nn.functional.normalize(sums, dim=1)
+        return centroids
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k, exclude=None):
+        mask = _excluded_mask(len(self), exclude)
+        probes = torch.topk(queries @ self.centroids.T, self.nprobe, dim=1).indices.tolist()
+        results = []
+        for query, clusters in zip(queries, probes):
+            candidates = torch.cat([self.order[self.offsets[cluster]:self.offsets[cluster + 1]] for cluster in clusters])
+            if mask is not None:
+                candidates = candidates[~mask[candidates]]
+            if len(candidates) == 0:
+                # Everything probed was excluded, fall back to the exact search for this query
+                results.append(ExactIndex(self.vectors).search(query.unsqueeze(0), k, exclude)[0])
+                continue
+            scores, best = torch.topk(self.vectors.take(candidates) @ query, min(k, len(candidates)))
+            results.append(list(zip(candidates[best].tolist(), scores.tolist())))
+        return results
+
+
+# HNSW graph from the optional hnswlib package. ef is the recall/latency setting of the search.
+# hnswlib keeps its own float32 copy of the vectors, whatever their stored representation.
+class HNSWIndex(object):
+    kind = 'hnsw'
+
+    def __init__(self, vectors, ef=64, M=16, ef_construction=200):
+        import hnswlib  # only needed when VECTOR_INDEX=hnsw
+
+        normalized = vectors.take()
+        self.size = normalized.shape[0]
+        self.ef = ef
+        self.index = hnswlib.Index(space='ip', dim=normalized.shape[1])
+        self.index.init_index(max_elements=max(1, self.size), ef_construction=ef_construction, M=M)
+        if self.size:
+            self.index.add_items(normalized.cpu().numpy(), list(range(self.size)))
+
+    def __len__(self):
+        return self.size
+
+    def search(self, queries, k, exclude=None):
+        excluded = set(torch.as_tensor(exclude).tolist()) if exclude is not None and len(exclude) else set()
+        # Over-fetch by the number of excluded subjects, so filtering them out still leaves k results
+        fetch = min(self.size, k + len(excluded))
+        if fetch <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        self.index.set_ef(max(self.ef, fetch))
+        labels, distances = self.index.knn_query(queries.cpu().numpy(), k=fetch)
+        results = []
+        for row_labels, row_distances in zip(labels.tolist(), distances.tolist()):
+            # The inner-product space reports 1 - similarity
+            hits = [(label, 1.0 - distance) for label, distance in zip(row_labels, row_distances) if label not in excluded]
+            results.append(hits[:k])
+        return results
+
+
+# Define function to build the configured index over the subject vectors
+def create_vector_index(vectors, kind='exact', **params):
+    if vectors is None:
+        return None
+    if kind == 'ivf':
+        return IVFIndex(vectors, nlist=params.get('nlist', 0), nprobe=params.get('nprobe', 8))
+    if kind == 'hnsw':
+        return HNSWIndex(vectors, ef=params.get('ef', 64), M=params.get('M', 16), ef_construction=params.get('ef_construction', 200))
+    if kind != 'exact':
+        raise ValueError(f"Unknown vector index {kind!r}, expected exact, ivf or hnsw")
+    return ExactIndex(vectors)
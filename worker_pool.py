@@ -0,0 +1,162 @@
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import chunked
+
+logger = logging.getLogger(__name__)
+
+
+# Define function to return the number of CPUs this process may run on
+def default_processes():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Runs in every worker process right after the fork
+def _init_worker(torch_threads):
+    import torch
+    import search
+    from config import config
+
+    # The processes share the cores, so each one runs torch on its own few threads
+    torch.set_num_threads(torch_threads)
+    # Connections inherited from the parent must not be used by the child. The parent owns the reference data;
+    # the workers keep the copy they were forked with instead of reloading it.
+    search.database.set_pool(None)
+    config.RULESET_TTL = 0
+
+
+# Define function to classify one chunk of courses in a worker, with classify_batch or match_course (the main() path).
+# Returns (version, results): the reference data version of the worker, which is the data it was forked with
+# and may be older than the parent's.
+def _classify_chunk(courses, method, spell_check, top_k):
+    import search
+
+    version = search.cache_version(search.get_ruleset())
+    if method == 'single':
+        return version, [search.match_course(course_prefix, course_title, university, top_k) for university, course_prefix, course_title in courses]
+    return version, search.classify_batch(courses, spell_check, top_k=top_k)
+
+
+# Define function to wait for a chunk and return (version, result) per course
+def _versioned(future):
+    version, results = future.result()
+    return [(version, result) for result in results]
+
+
+# Define function to build the result of a course whose worker crashed every time it was classified
+def _error_result(error):
+    return {'course_subject': None, 'similarity_rate': 0.0, 'department_abbreviations': [], 'match_method': 'Error',
+            'alternatives': [], 'error': error}
+
+
+# Pool of worker processes forked after the model and the reference data are loaded, so every worker shares
+# them copy-on-write. Courses are sent in chunks to whichever worker is free, with at most two chunks per worker
+# in flight, and results come back in input order. When a worker dies, the pool is restarted and the unfinished
+# chunks are run again one at a time, split in halves until the course that kills the worker is found. That course
+# gets an error result, and every other course is classified normally.
+class WorkerPool(object):
+    def __init__(self, processes=0, chunk_size=500, method='batch', spell_check=None, top_k=3, torch_threads=1):
+        import search
+
+        # Load everything before forking, so the workers don't each load it again
+        if not search.ready.is_set():
+            search.setup()
+        self.processes = processes or default_processes()
+        self.chunk_size = chunk_size
+        self.method = method
+        self.spell_check = spell_check
+        self.top_k = top_k
+        self.torch_threads = torch_threads
+        self.crashes = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('fork'),
+                                                 initializer=_init_worker, initargs=(self.torch_threads,))
+        return self._executor
+
+    def _restart(self):
+        self.crashes += 1
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _submit(self, courses):
+        import search
+
+        if self._executor is None:
+            # The workers are forked by this first submit. A reload (e.g. the background one setup() starts after
+            # restoring a snapshot) holds the model and reload locks and swaps the data in several steps, so wait
+            # for it to finish: a child forked in the middle would inherit held locks and half of the new data.
+            with search._reload_lock:
+                return self._get_executor().submit(_classify_chunk, courses, self.method, self.spell_check, self.top_k)
+        return self._executor.submit(_classify_chunk, courses, self.method, self.spell_check, self.top_k)
+
+    # Classify courses on their own, halving them after every crash until the failing course is isolated
+    def _isolate(self, courses):
+        try:
+            return _versioned(self._submit(courses))
+        except BrokenProcessPool:
+            self._restart()
+        if len(courses) == 1:
+            logger.error("A worker crashed on every attempt to classify %s", courses[0])
+            return [(None, _error_result('worker crashed'))]
+        middle = len(courses) // 2
+        return self._isolate(courses[:middle]) + self._isolate(courses[middle:])
+
+    # Classify an iterable of (university, course_prefix, course_title) rows; yields one result per row, in order.
+    # With versions, yields (version, result) instead, version being the reference data version the result was
+    # computed with (None for a course that crashed its worker).
+    def classify(self, courses, versions=False):
+        chunks = chunked(courses, self.chunk_size)
+        pending = deque()  # [courses, future, results] per chunk in flight, in input order
+
+        def fill():
+            while len(pending) < self.processes * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                pending.append([chunk, self._submit(chunk), None])
+
+        fill()
+        while pending:
+            entry = pending[0]
+            if entry[2] is None:
+                try:
+                    entry[2] = _versioned(entry[1])
+                except BrokenProcessPool:
+                    # The crash can't be pinned on one chunk, so every chunk that didn't finish is rerun in isolation
+                    logger.warning("A worker process died, restarting the pool")
+                    self._restart()
+                    for other in pending:
+                        future = other[1]
+                        if other[2] is not None:
+                            continue
+                        if future.done() and not future.cancelled() and future.exception() is None:
+                            other[2] = _versioned(future)
+                        else:
+                            other[2] = self._isolate(other[0])
+            pending.popleft()
+            fill()
+            if versions:
+                yield from entry[2]
+            else:
+                for version, result in entry[2]:
+                    yield result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()